@@ -0,0 +1,55 @@
+"""Benchmark: compiled injection rule engine vs. the per-pattern loop.
+
+Run from the security-function-v2 directory:
+
+    python benchmarks/bench_injection_patterns.py
+
+NOTE: Attack strings below are FAKE test fixtures used only to exercise
+the detection patterns.
+"""
+
+import os
+import re
+import sys
+import timeit
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.injection_patterns import INJECTION_PATTERNS, check_patterns
+
+SAMPLES = {
+    "clean_short": "summit",
+    "clean_location": "Denver, Colorado",
+    "clean_sentence": "Recommend gear for a two day hike above the tree line in early June",
+    "shell_injection": "Denver; cat /etc/passwd",
+    "path_traversal": "../../etc/passwd",
+    "sql_late_rule": "' OR '1'='1",
+}
+
+
+def legacy_check_patterns(text: str) -> tuple[str, str] | None:
+    """The original implementation: one re.search per pattern per text."""
+    for category, patterns in INJECTION_PATTERNS.items():
+        for pattern, description in patterns:
+            if re.search(pattern, text, re.IGNORECASE | re.MULTILINE):
+                return category, description
+    return None
+
+
+def ns_per_op(func, text: str, number: int) -> float:
+    """Best-of-5 nanoseconds per call."""
+    timings = timeit.repeat(lambda: func(text), number=number, repeat=5)
+    return min(timings) / number * 1e9
+
+
+def main(number: int = 20000) -> None:
+    print(f"{'sample':<18}{'legacy ns/op':>14}{'compiled ns/op':>16}{'speedup':>10}")
+    for name, text in SAMPLES.items():
+        legacy = ns_per_op(legacy_check_patterns, text, number)
+        compiled = ns_per_op(check_patterns, text, number)
+        print(f"{name:<18}{legacy:>14.0f}{compiled:>16.0f}{legacy / compiled:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
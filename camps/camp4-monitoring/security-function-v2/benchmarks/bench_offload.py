@@ -0,0 +1,71 @@
+"""Benchmark: small-request latency while large bodies are being scanned.
+
+Runs a mix of small tool calls and a few multi-MB tool outputs concurrently
+on one event loop, once with everything inline and once with large bodies
+offloaded to the process pool. Reports p50/p99 latency of the small
+requests and overall throughput.
+
+Run from the security-function-v2 directory:
+
+    python benchmarks/bench_offload.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import offload
+from shared.credential_scanner import scan_and_redact
+
+SMALL_REQUESTS = 400
+LARGE_REQUESTS = 4
+LARGE_BODY = "Trail report: clear skies, light wind. " * 100_000  # ~4 MB
+SMALL_BODY = "Forecast for Mount Rainier: sunny. " * 10
+
+
+async def timed(text: str, arrival: float) -> float:
+    await offload.run_scan(scan_and_redact, text, size=len(text))
+    # Measured from arrival, so time spent queued behind a blocked loop counts
+    return time.perf_counter() - arrival
+
+
+async def run_mix() -> tuple[list[float], float]:
+    start = time.perf_counter()
+    large, small = [], []
+    for i in range(SMALL_REQUESTS):
+        if i % (SMALL_REQUESTS // LARGE_REQUESTS) == 0:
+            large.append(asyncio.create_task(timed(LARGE_BODY, time.perf_counter())))
+        small.append(asyncio.create_task(timed(SMALL_BODY, time.perf_counter())))
+        await asyncio.sleep(0.001)
+    small_latencies = await asyncio.gather(*small)
+    await asyncio.gather(*large)
+    return small_latencies, time.perf_counter() - start
+
+
+def report(label: str, small: list[float], elapsed: float) -> None:
+    quantiles = statistics.quantiles(small, n=100)
+    total = SMALL_REQUESTS + LARGE_REQUESTS
+    print(
+        f"{label:<10} small p50 {quantiles[49] * 1000:8.2f} ms  "
+        f"p99 {quantiles[98] * 1000:8.2f} ms  {total / elapsed:8.1f} req/s"
+    )
+
+
+def main() -> None:
+    os.environ["OFFLOAD_MAX_WORKERS"] = "0"
+    report("inline", *asyncio.run(run_mix()))
+
+    os.environ["OFFLOAD_MAX_WORKERS"] = str(os.cpu_count() or 1)
+    offload.get_process_pool()
+    time.sleep(2)  # let spawned workers finish warming
+    report("offload", *asyncio.run(run_mix()))
+    offload.shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Benchmark: repeated sanitize calls with a per-call vs. shared Language client.
+
+Serves a canned Azure AI Language analyze-text response from a local HTTP
+server after SERVICE_LATENCY_SECONDS, and authenticates with a credential that takes TOKEN_LATENCY_SECONDS
+to issue a token (roughly a managed identity endpoint round trip). Compares
+building a new credential and TextAnalyticsClient for every call (the old
+get_client) with the process-wide client, then a 50 KB response sent one
+chunk per request vs. PII_BATCH_DOCUMENTS chunks per request, and finally
+CONCURRENT_REQUESTS 50 KB sanitize calls on one event loop through the aio
+client vs. the same calls made one after another.
+
+The local server is plain HTTP, so the TLS handshake a real connection pays
+on every new client is not included; real savings are larger.
+
+Run from the security-function-v2 directory:
+
+    python benchmarks/bench_pii_client.py
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from azure.ai.textanalytics import TextAnalyticsClient
+from azure.core.credentials import AccessToken
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import pii_detector
+
+CALLS = 50
+CONCURRENT_REQUESTS = 10
+TOKEN_LATENCY_SECONDS = 0.05
+SERVICE_LATENCY_SECONDS = 0.02
+TEXT = "Guide contact: jordan.rivers@example.com"
+LARGE_TEXT = (TEXT + " Trail report: clear skies. ") * 750  # ~50 KB
+
+
+class LanguageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # One write per response, so Nagle + delayed ACK don't add 40 ms to keep-alive calls
+    wbufsize = 64 * 1024
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        documents = request["analysisInput"]["documents"]
+        time.sleep(SERVICE_LATENCY_SECONDS)
+        body = json.dumps({
+            "kind": "PiiEntityRecognitionResults",
+            "results": {
+                "documents": [
+                    {"id": doc["id"], "redactedText": doc["text"], "entities": [], "warnings": []}
+                    for doc in documents
+                ],
+                "errors": [],
+                "modelVersion": "2023-09-01",
+            },
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowTokenCredential:
+    """Issues a token after TOKEN_LATENCY_SECONDS, like a real token endpoint."""
+
+    def get_token(self, *scopes, **kwargs):
+        time.sleep(TOKEN_LATENCY_SECONDS)
+        return AccessToken("fake-token", int(time.time()) + 3600)
+
+    def close(self):
+        pass
+
+
+class AsyncSlowTokenCredential:
+    async def get_token(self, *scopes, **kwargs):
+        await asyncio.sleep(TOKEN_LATENCY_SECONDS)
+        return AccessToken("fake-token", int(time.time()) + 3600)
+
+    async def close(self):
+        pass
+
+
+def per_call_client():
+    """The old get_client(): new credential and client every time."""
+    return TextAnalyticsClient(endpoint=os.environ["AI_SERVICES_ENDPOINT"], credential=SlowTokenCredential())
+
+
+def timed_calls(text: str = TEXT) -> list[float]:
+    samples = []
+    for _ in range(CALLS):
+        start = time.perf_counter()
+        result = pii_detector.detect_and_redact_pii(text)
+        samples.append(time.perf_counter() - start)
+        assert result.error is None, result.error
+    return samples
+
+
+async def concurrent_calls() -> float:
+    await pii_detector.detect_and_redact_pii_async(TEXT)  # warm the token
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(pii_detector.detect_and_redact_pii_async(LARGE_TEXT) for _ in range(CONCURRENT_REQUESTS))
+    )
+    assert all(result.error is None for result in results)
+    elapsed = time.perf_counter() - start
+    await pii_detector.close_async_client()
+    return elapsed
+
+
+def report(label: str, samples: list[float]) -> None:
+    print(
+        f"{label:<16} p50 {statistics.median(samples) * 1000:7.2f} ms  "
+        f"mean {statistics.fmean(samples) * 1000:7.2f} ms  max {max(samples) * 1000:7.2f} ms"
+    )
+
+
+def main() -> None:
+    # Default listen backlog (5) drops concurrent connects into 1 s SYN retries
+    ThreadingHTTPServer.request_queue_size = 64
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LanguageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["AI_SERVICES_ENDPOINT"] = f"http://127.0.0.1:{server.server_port}"
+
+    # Bearer tokens over plain HTTP are only allowed when asked for explicitly
+    call_options = pii_detector.call_options
+    pii_detector.call_options = lambda deadline: {**call_options(deadline), "enforce_https": False}
+    pii_detector._create_credential = SlowTokenCredential
+
+    shared_get_client = pii_detector.get_client
+    pii_detector.get_client = per_call_client
+    report("per-call", timed_calls())
+
+    pii_detector.get_client = shared_get_client
+    report("shared", timed_calls())
+
+    os.environ["PII_BATCH_DOCUMENTS"] = "1"
+    report("50KB unbatched", timed_calls(LARGE_TEXT))
+    del os.environ["PII_BATCH_DOCUMENTS"]
+    report("50KB batched", timed_calls(LARGE_TEXT))
+
+    pii_detector._create_async_credential = AsyncSlowTokenCredential
+    sequential = sum(timed_calls(LARGE_TEXT)[:CONCURRENT_REQUESTS])
+    concurrent = asyncio.run(concurrent_calls())
+    print(
+        f"{CONCURRENT_REQUESTS} x 50KB     sequential sync {sequential * 1000:7.2f} ms  "
+        f"concurrent async {concurrent * 1000:7.2f} ms"
+    )
+
+    pii_detector.reset_client()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
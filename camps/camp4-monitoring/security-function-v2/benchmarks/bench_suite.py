@@ -0,0 +1,202 @@
+"""Benchmark suite for the security function detectors.
+
+Times the detectors on the shared corpus (benchmarks/corpus.py) and
+reports ops/sec, p50/p99 latency and peak allocation per operation:
+
+- check_patterns on attack texts and argument-sized benign texts
+- check_mcp_request on benign and attack MCP bodies
+- scan_and_redact and find_high_entropy_strings on tool responses
+- detect_and_redact_pii's redaction loop, driven by a canned Language
+  client so no network call is made (the service round trip is not what
+  is being measured)
+
+Run from the security-function-v2 directory:
+
+    python benchmarks/bench_suite.py                       # report
+    python benchmarks/bench_suite.py --save baseline.json  # record a baseline
+    python benchmarks/bench_suite.py --compare baseline.json
+
+--compare exits non-zero if any case's p50 is more than --tolerance
+(default 20%) slower than the baseline. Baselines are only comparable on
+the same machine.
+
+NOTE: Attack strings and credentials used here are FAKE test fixtures
+used only to exercise the detection patterns.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable, NamedTuple
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import corpus
+from shared import pii_detector
+from shared.credential_scanner import find_high_entropy_strings, scan_and_redact
+from shared.injection_patterns import check_mcp_request, check_patterns
+
+DEFAULT_MIN_TIME_SECONDS = 0.5
+DEFAULT_TOLERANCE = 0.2
+
+# Entities the canned Language client "finds", matching the corpus contacts
+FAKE_PII_PATTERNS = [
+    (re.compile(r"[\w.]+@example\.(?:com|org)"), "Email"),
+    (re.compile(r"\(?555\)? ?\d{3}-\d{4}|555-\d{4}"), "PhoneNumber"),
+    (re.compile(r"\b(?:Jordan Rivers|Casey Stone)\b"), "Person"),
+]
+
+
+class BenchResult(NamedTuple):
+    """Timing and allocation figures for one benchmark case."""
+    ops_per_sec: float
+    p50_us: float
+    p99_us: float
+    peak_alloc_kb: float
+
+
+class FakeLanguageClient:
+    """Answers recognize_pii_entities locally with precomputed entities."""
+
+    def recognize_pii_entities(self, documents, **kwargs):
+        results = []
+        for document in documents:
+            entities = [
+                SimpleNamespace(
+                    category=category, subcategory=None, confidence_score=0.99,
+                    offset=match.start(), length=match.end() - match.start()
+                )
+                for pattern, category in FAKE_PII_PATTERNS
+                for match in pattern.finditer(document)
+            ]
+            results.append(SimpleNamespace(is_error=False, error=None, entities=entities))
+        return results
+
+
+def cases() -> dict[str, Callable[[], object]]:
+    """Benchmark cases: name -> zero-argument callable doing one operation."""
+    benign_texts = [text for _, arguments in corpus.BENIGN_ARGUMENTS for text in arguments.values() if isinstance(text, str)]
+    attack_texts = corpus.attack_texts()
+    benign_bodies = corpus.benign_bodies()
+    attack_bodies = corpus.attack_bodies()
+    responses = corpus.tool_responses()
+
+    def each(func, inputs):
+        return lambda: [func(item) for item in inputs]
+
+    suite = {
+        "check_patterns/benign": each(check_patterns, benign_texts),
+        "check_patterns/attack": each(check_patterns, attack_texts),
+        "check_mcp_request/benign": each(check_mcp_request, benign_bodies),
+        "check_mcp_request/attack": each(check_mcp_request, attack_bodies),
+    }
+    for size, text in responses.items():
+        suite[f"scan_and_redact/{size}"] = lambda text=text: scan_and_redact(text)
+        suite[f"find_high_entropy_strings/{size}"] = lambda text=text: find_high_entropy_strings(text)
+    for size in ("16KB", "256KB"):
+        suite[f"pii_redaction/{size}"] = lambda text=responses[size]: pii_detector.detect_and_redact_pii(text)
+    return suite
+
+
+def measure(func: Callable[[], object], min_time: float) -> BenchResult:
+    """Time func until min_time has elapsed (at least 5 calls), then measure allocations."""
+    func()  # warm caches and lazy singletons
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < 5 or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    quantiles = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return BenchResult(
+        ops_per_sec=len(samples) / sum(samples),
+        p50_us=quantiles[49] * 1e6,
+        p99_us=quantiles[98] * 1e6,
+        peak_alloc_kb=(peak - baseline) / 1024,
+    )
+
+
+def run(min_time: float, selected: str | None = None) -> dict[str, BenchResult]:
+    """Run every case whose name contains `selected`."""
+    original_get_client = pii_detector.get_client
+    pii_detector.get_client = lambda: FakeLanguageClient()
+    try:
+        return {
+            name: measure(func, min_time)
+            for name, func in cases().items()
+            if selected is None or selected in name
+        }
+    finally:
+        pii_detector.get_client = original_get_client
+
+
+def compare(results: dict[str, BenchResult], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """
+    Compare p50 latencies against a saved baseline.
+
+    Returns:
+        Names of cases slower than the baseline by more than tolerance
+    """
+    regressions = []
+    print(f"\n{'case':<36}{'baseline p50':>14}{'p50':>12}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["p50_us"]
+        change = (result.p50_us - before) / before if before else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"{name:<36}{before:>14.1f}{result.p50_us:>12.1f}{change:>+9.0%}{flag}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME_SECONDS, help="seconds per case")
+    parser.add_argument("--filter", help="only run cases whose name contains this")
+    parser.add_argument("--save", metavar="PATH", help="write results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed p50 slowdown")
+    args = parser.parse_args(argv)
+
+    results = run(args.min_time, args.filter)
+
+    print(f"{'case':<36}{'ops/sec':>12}{'p50 us':>12}{'p99 us':>12}{'peak KB':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<36}{result.ops_per_sec:>12.1f}{result.p50_us:>12.1f}"
+            f"{result.p99_us:>12.1f}{result.peak_alloc_kb:>10.1f}"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({name: result._asdict() for name, result in results.items()}, f, indent=2)
+        print(f"\nBaseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed beyond {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
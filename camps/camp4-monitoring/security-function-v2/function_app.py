@@ -14,9 +14,22 @@ import logging
 import traceback
 import azure.functions as func
 
-from shared.injection_patterns import check_mcp_request_async, extract_texts_from_mcp_request
-from shared.pii_detector import detect_and_redact_pii
+from shared.injection_patterns import (
+    check_mcp_batch_async,
+    check_mcp_request_async,
+    extract_texts_from_mcp_request,
+)
+from shared.pii_detector import (
+    detect_and_redact_json_pii_async,
+    detect_and_redact_pii_async,
+    pii_json_mode_enabled,
+)
 from shared.credential_scanner import scan_and_redact
+from shared.known_bad import get_known_bad_payloads
+from shared.offload import run_scan
+from shared.prompt_shields import GATEWAY_VERDICT_HEADER, gateway_cleared_texts, get_verdict_cache
+from shared.resilience import Deadline
+from shared.rule_packs import get_active_rule_pack
 from shared.security_logger import (
     configure_telemetry,
     generate_correlation_id,
@@ -25,11 +38,15 @@ from shared.security_logger import (
     log_credential_detected,
     log_input_check_passed,
     log_security_error,
+    log_cache_stats,
 )
 
 # Configure Azure Monitor telemetry on startup
 configure_telemetry()
 
+# Compile the detection rule pack once per worker, before the first request
+get_active_rule_pack()
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -39,7 +56,34 @@ app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
 def get_tool_name(body: dict) -> str | None:
     """Extract MCP tool name from request body if present."""
-    return body.get("params", {}).get("name")
+    params = body.get("params")
+    if not isinstance(params, dict):
+        return None
+    name = params.get("name")
+    return name if isinstance(name, str) else None
+
+
+def get_batch_tool_name(bodies: list) -> str | None:
+    """Comma-separated MCP tool names found in a JSON-RPC batch."""
+    names = [get_tool_name(b) for b in bodies if isinstance(b, dict)]
+    names = [name for name in names if name]
+    return ",".join(names) if names else None
+
+
+def format_batch_items(bodies: list, items: list) -> list[dict]:
+    """Per-element verdicts for a batch response, keyed by index and JSON-RPC id."""
+    details = []
+    for index, (body, item) in enumerate(zip(bodies, items)):
+        detail = {
+            "index": index,
+            "id": body.get("id") if isinstance(body, dict) else None,
+            "allowed": item.is_safe
+        }
+        if not item.is_safe:
+            detail["reason"] = item.reason
+            detail["category"] = item.category
+        details.append(detail)
+    return details
 
 
 @app.route(route="input-check", methods=["POST"])
@@ -48,13 +92,22 @@ async def input_check(req: func.HttpRequest) -> func.HttpResponse:
     Check incoming MCP request for injection patterns.
 
     Hybrid approach:
+    0. Replays of previously blocked payloads are rejected from a hash set
     1. Fast regex check for known patterns (shell, SQL, path traversal)
     2. Azure AI Content Safety Prompt Shields for sophisticated prompt injection
+       (skipped when the x-prompt-shields-cleared header proves APIM already
+       ran Prompt Shields on this exact body)
+
+    The body may be a single JSON-RPC request or a batch array. Batches get
+    one overall verdict plus per-element detail in "items".
 
     Returns:
-        JSON: {"allowed": true/false, "reason": string, "category": string}
+        JSON: {"allowed": true/false, "reason": string, "category": string,
+               "items": [{"index", "id", "allowed", ...}] (batches only)}
     """
     correlation_id = req.headers.get("x-correlation-id", generate_correlation_id())
+    # Time budget shared by every outbound call made for this request
+    deadline = Deadline.for_request(correlation_id)
 
     try:
         # Parse request body
@@ -72,7 +125,8 @@ async def input_check(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
 
-        if not body:
+        # An empty batch ([]) is an invalid JSON-RPC request, checked below
+        if not body and not isinstance(body, list):
             log_input_check_passed(correlation_id=correlation_id)
             return func.HttpResponse(
                 json.dumps({"allowed": True}),
@@ -80,10 +134,37 @@ async def input_check(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
 
-        tool_name = get_tool_name(body)
+        # Texts the APIM fragment already cleared with Prompt Shields are not sent again
+        gateway_cleared = gateway_cleared_texts(req.headers.get(GATEWAY_VERDICT_HEADER), body)
+
+        batch_items = None
+        if isinstance(body, list):
+            # JSON-RPC batch: check every element, sharing the Prompt Shields call
+            batch_result = await check_mcp_batch_async(
+                body,
+                gateway_cleared=gateway_cleared,
+                deadline=deadline
+            )
+            result = batch_result.result
+            batch_items = format_batch_items(body, batch_result.items)
+            blocked_items = [i for i, item in enumerate(batch_result.items) if not item.is_safe]
+            tool_name = get_batch_tool_name([body[i] for i in blocked_items] or body)
+        else:
+            tool_name = get_tool_name(body)
+
+            # Hybrid check: regex + Prompt Shields
+            result = await check_mcp_request_async(
+                body,
+                gateway_cleared=gateway_cleared,
+                deadline=deadline
+            )
 
-        # Hybrid check: regex + Prompt Shields
-        result = await check_mcp_request_async(body)
+        verdict_cache = get_verdict_cache()
+        if verdict_cache is not None and verdict_cache.should_report():
+            log_cache_stats("prompt_shields_verdicts", verdict_cache.stats(), correlation_id)
+        known_bad = get_known_bad_payloads()
+        if known_bad is not None and known_bad.should_report():
+            log_cache_stats("known_bad_payloads", known_bad.stats(), correlation_id)
 
         if not result.is_safe:
             log_injection_blocked(
@@ -92,19 +173,25 @@ async def input_check(req: func.HttpRequest) -> func.HttpResponse:
                 correlation_id=correlation_id,
                 tool_name=tool_name
             )
+            response = {
+                "allowed": False,
+                "reason": result.reason,
+                "category": result.category
+            }
+            if batch_items is not None:
+                response["items"] = batch_items
             return func.HttpResponse(
-                json.dumps({
-                    "allowed": False,
-                    "reason": result.reason,
-                    "category": result.category
-                }),
+                json.dumps(response),
                 status_code=200,
                 mimetype="application/json"
             )
 
         log_input_check_passed(correlation_id=correlation_id, tool_name=tool_name)
+        response = {"allowed": True}
+        if batch_items is not None:
+            response["items"] = batch_items
         return func.HttpResponse(
-            json.dumps({"allowed": True}),
+            json.dumps(response),
             status_code=200,
             mimetype="application/json"
         )
@@ -124,18 +211,23 @@ async def input_check(req: func.HttpRequest) -> func.HttpResponse:
 
 
 @app.route(route="sanitize-output", methods=["POST"])
-def sanitize_output(req: func.HttpRequest) -> func.HttpResponse:
+async def sanitize_output(req: func.HttpRequest) -> func.HttpResponse:
     """
     Sanitize MCP response by redacting PII and credentials.
 
     Performs:
-    - PII detection using Azure AI Language (MCP10)
-    - Credential pattern scanning (MCP01)
+    - PII detection using Azure AI Language (MCP10), with chunk batches
+      sent concurrently on the aio client; JSON bodies submit only their
+      string leaves (PII_JSON_MODE)
+    - Credential pattern scanning (MCP01), in the scanning process pool
+      for bodies above OFFLOAD_THRESHOLD_BYTES
 
     Returns:
         The sanitized response body with sensitive data redacted
     """
     correlation_id = req.headers.get("x-correlation-id", generate_correlation_id())
+    # Time budget shared by every outbound call made for this request
+    deadline = Deadline.for_request(correlation_id)
 
     try:
         # Get raw body as text
@@ -149,7 +241,10 @@ def sanitize_output(req: func.HttpRequest) -> func.HttpResponse:
             )
 
         # Step 1: Detect and redact PII using Azure AI Language
-        pii_result = detect_and_redact_pii(body_text)
+        if pii_json_mode_enabled():
+            pii_result = await detect_and_redact_json_pii_async(body_text, deadline)
+        else:
+            pii_result = await detect_and_redact_pii_async(body_text, deadline)
         sanitized_text = pii_result.redacted_text
 
         if pii_result.entities_found:
@@ -168,7 +263,7 @@ def sanitize_output(req: func.HttpRequest) -> func.HttpResponse:
             )
 
         # Step 2: Scan and redact credentials
-        cred_result = scan_and_redact(sanitized_text)
+        cred_result = await run_scan(scan_and_redact, sanitized_text, size=len(sanitized_text))
         sanitized_text = cred_result.redacted_text
 
         if cred_result.credentials_found:
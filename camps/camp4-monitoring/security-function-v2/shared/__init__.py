@@ -10,4 +10,5 @@ from .security_logger import (
     log_credential_detected,
     log_input_check_passed,
     log_security_error,
+    log_cache_stats,
 )
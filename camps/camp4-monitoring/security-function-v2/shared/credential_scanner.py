@@ -9,10 +9,17 @@ Scans text for common credential patterns to prevent accidental exposure
 of API keys, passwords, JWTs, and other secrets in MCP responses.
 """
 
+import logging
 import math
 import re
 from typing import NamedTuple
 
+from .redaction import RedactionBuilder
+from .regex_engine import RegexTimeoutError, compile_pattern
+from .rule_packs import get_active_rule_pack
+
+logger = logging.getLogger(__name__)
+
 
 class CredentialResult(NamedTuple):
     """Result of credential scanning."""
@@ -78,6 +85,34 @@ MIN_SECRET_LENGTH = 20   # Minimum length to consider for entropy analysis
 MAX_SECRET_LENGTH = 200  # Maximum length to consider (avoid analyzing large blobs)
 
 
+def compile_credential_patterns(
+    patterns: list[tuple[str, str, str]] = CREDENTIAL_PATTERNS
+) -> list[tuple[re.Pattern, str, str, str]]:
+    """
+    Compile credential patterns once with the configured regex engine.
+
+    Args:
+        patterns: (pattern, cred_type, replacement) tuples
+
+    Returns:
+        List of (compiled, cred_type, replacement, pattern) tuples; invalid
+        patterns are skipped
+    """
+    compiled = []
+    for pattern, cred_type, replacement in patterns:
+        try:
+            compiled.append((compile_pattern(pattern, re.MULTILINE), cred_type, replacement, pattern))
+        except re.error:
+            # Skip invalid patterns
+            continue
+    return compiled
+
+
+_entropy_candidate = compile_pattern(
+    r'\b[a-zA-Z0-9+/=_-]{' + str(MIN_SECRET_LENGTH) + r',' + str(MAX_SECRET_LENGTH) + r'}\b'
+)
+
+
 def calculate_entropy(text: str) -> float:
     """
     Calculate Shannon entropy of a string.
@@ -124,13 +159,13 @@ def find_high_entropy_strings(text: str) -> list[tuple[int, int, str, float]]:
         
     Returns:
         List of (start, end, matched_string, entropy) tuples
+
+    Raises:
+        RegexTimeoutError: If the scan exceeds the configured time limit
     """
     # Pattern to find potential secret strings (alphanumeric with common secret chars)
     # Excludes common words by requiring mixed case or numbers
-    potential_secrets = re.finditer(
-        r'\b[a-zA-Z0-9+/=_-]{' + str(MIN_SECRET_LENGTH) + r',' + str(MAX_SECRET_LENGTH) + r'}\b',
-        text
-    )
+    potential_secrets = _entropy_candidate.finditer(text)
     
     high_entropy_matches = []
     for match in potential_secrets:
@@ -161,9 +196,13 @@ def scan_and_redact(text: str) -> CredentialResult:
     Scan text for credential patterns and high-entropy secrets, then redact them.
     
     Hybrid approach:
-    1. First, apply regex patterns for known credential formats
+    1. First, apply regex patterns for known credential formats (from the
+       active rule pack)
     2. Then, use entropy analysis to catch unknown secret types
     
+    Both phases scan the original text and report spans; overlapping
+    findings are merged (see redaction) and the text is rebuilt once.
+    
     Args:
         text: The text to scan for credentials
         
@@ -173,48 +212,45 @@ def scan_and_redact(text: str) -> CredentialResult:
     if not text:
         return CredentialResult(redacted_text=text, credentials_found=[])
     
-    redacted = text
-    credentials_found = []
+    builder = RedactionBuilder(text)
+    credential_patterns = get_active_rule_pack().credential_patterns
     
-    # Phase 1: Regex-based pattern matching for known credential types
-    for pattern, cred_type, replacement in CREDENTIAL_PATTERNS:
+    # Phase 1: Regex-based pattern matching for known credential types.
+    # Earlier patterns take precedence where matches overlap.
+    for priority, (regex, cred_type, replacement, pattern) in enumerate(credential_patterns):
         try:
-            matches = list(re.finditer(pattern, redacted, re.MULTILINE))
-            for match in matches:
-                credentials_found.append({
+            for match in regex.finditer(text):
+                builder.add(match.start(), match.end(), match.expand(replacement), priority, {
                     "type": cred_type,
                     "pattern": pattern[:50] + "..." if len(pattern) > 50 else pattern,
                     "position": match.start(),
                     "detection": "regex"
                 })
-            
-            redacted = re.sub(pattern, replacement, redacted, flags=re.MULTILINE)
-        except re.error:
-            # Skip invalid patterns
+        except RegexTimeoutError as e:
+            # Output is already past the tool; skip the pattern rather than
+            # fail the whole response
+            logger.warning(f"Skipping credential pattern {cred_type}: {e}")
             continue
     
-    # Phase 2: Entropy-based detection for unknown secrets
-    # Run on the already-redacted text to avoid double-detection
-    high_entropy_secrets = find_high_entropy_strings(redacted)
-    
-    # Sort by position descending so we can replace without offset issues
-    high_entropy_secrets.sort(key=lambda x: x[0], reverse=True)
+    # Phase 2: Entropy-based detection for unknown secrets, ranked below
+    # every known format so overlaps keep the regex label
+    try:
+        high_entropy_secrets = find_high_entropy_strings(text)
+    except RegexTimeoutError as e:
+        logger.warning(f"Skipping entropy scan: {e}")
+        high_entropy_secrets = []
     
     for start, end, secret, entropy in high_entropy_secrets:
-        # Skip if this looks like it was already redacted
-        if "[REDACTED" in secret:
-            continue
-            
-        credentials_found.append({
+        builder.add(start, end, "[REDACTED-HIGH_ENTROPY]", len(credential_patterns), {
             "type": "HIGH_ENTROPY_SECRET",
             "entropy": round(entropy, 2),
             "position": start,
             "length": len(secret),
             "detection": "entropy"
         })
-        
-        # Redact the high-entropy string
-        redacted = redacted[:start] + "[REDACTED-HIGH_ENTROPY]" + redacted[end:]
+    
+    redacted, spans = builder.build()
+    credentials_found = [span.finding for span in spans]
     
     return CredentialResult(
         redacted_text=redacted,
@@ -8,13 +8,36 @@ Hybrid approach combining:
 Organized by OWASP MCP risk category for clear documentation and maintenance.
 """
 
+import asyncio
+import functools
+import json
 import os
 import re
 import logging
-from typing import NamedTuple
+import unicodedata
+from typing import Iterable, Iterator, NamedTuple
+from urllib.parse import unquote
 
-import aiohttp
-from azure.identity.aio import DefaultAzureCredential
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from .known_bad import get_known_bad_payloads, payload_digest
+from .offload import offload_threshold, run_scan
+from .prompt_shields import (
+    PromptShieldsError,
+    get_prompt_shields_client,
+    get_verdict_cache,
+    plan_shield_prompt_requests,
+    prompt_cache_key,
+)
+from .regex_engine import RegexTimeoutError, compile_pattern
+from .resilience import CircuitBreaker, Deadline, get_circuit_breaker
+from .rule_packs import get_active_rule_pack
+from .security_logger import log_risk_gate_shadow_miss
+from .security_profiles import SecurityProfile, resolve_security_profile
+from .tool_schemas import ArgumentSchema, get_arguments_schema
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +49,12 @@ class DetectionResult(NamedTuple):
     reason: str
 
 
+class BatchDetectionResult(NamedTuple):
+    """Result of checking a JSON-RPC batch: overall verdict plus one per element."""
+    result: DetectionResult
+    items: list[DetectionResult]
+
+
 # Organized by OWASP MCP risk category
 INJECTION_PATTERNS: dict[str, list[tuple[str, str]]] = {
     # MCP05: Command Injection - Shell/OS command execution
@@ -44,8 +73,6 @@ INJECTION_PATTERNS: dict[str, list[tuple[str, str]]] = {
          "Destructive command chain detected"),
         (r"\$\{[^}]+\}",
          "Shell variable expansion detected"),
-        (r"\\x[0-9a-fA-F]{2}",
-         "Hex-encoded shell character detected"),
     ],
     
     # MCP05: SQL Injection - Database query manipulation
@@ -76,10 +103,10 @@ INJECTION_PATTERNS: dict[str, list[tuple[str, str]]] = {
          "Directory traversal (../) detected"),
         (r"\.\.\\",
          r"Directory traversal (..\) detected"),
-        (r"%2e%2e[%2f/\\]",
-         "URL-encoded directory traversal detected"),
-        (r"%252e%252e",
-         "Double URL-encoded traversal detected"),
+        # Text is URL-decoded before matching; this catches dots still
+        # encoded after MAX_DECODE_PASSES rounds
+        (r"%(25)*2e%(25)*2e",
+         "Over-encoded directory traversal detected"),
         (r"/etc/(passwd|shadow|hosts|sudoers)",
          "Sensitive Unix file access detected"),
         (r"/proc/(self|[0-9]+)/(environ|cmdline|fd)",
@@ -94,10 +121,309 @@ INJECTION_PATTERNS: dict[str, list[tuple[str, str]]] = {
 }
 
 
+class CompiledRule(NamedTuple):
+    """A single injection pattern compiled with its category and description."""
+    category: str
+    description: str
+    pattern: str
+    # Compiled with the engine selected by DETECTION_REGEX_ENGINE
+    regex: re.Pattern
+    # Casefolded literal (str) or character set (frozenset) that every match
+    # must contain; None when no trigger could be derived from the pattern.
+    trigger: str | frozenset[str] | None
+
+
+def derive_trigger(pattern: str, flags: int = 0) -> str | frozenset[str] | None:
+    """
+    Derive a literal prefilter trigger from a regex pattern.
+
+    Walks the top-level sequence of the parsed pattern and returns the longest
+    run of mandatory literal characters (e.g. "union", "/etc/", "%2e%2e").
+    Patterns without such a run but with a mandatory plain character class
+    (e.g. ``[;&|`]``) return that set of characters instead. Anything that
+    cannot be reasoned about (top-level alternation, negated classes...)
+    returns None so the rule is always evaluated.
+
+    Args:
+        pattern: The regex pattern
+        flags: Flags the pattern will be compiled with
+
+    Returns:
+        Casefolded literal string, frozenset of casefolded characters, or None
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return None
+
+    runs: list[str] = []
+    char_classes: list[frozenset[str]] = []
+    current = ""
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            current += chr(av)
+            continue
+        # Mandatory repeat of a single literal (e.g. "x{2,}") contributes one
+        # occurrence of the character and then ends the run.
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, _, item = av
+            if low >= 1 and len(item) == 1 and item[0][0] is sre_parse.LITERAL:
+                runs.append(current + chr(item[0][1]))
+                current = ""
+                continue
+        if op is sre_parse.IN and all(item_op is sre_parse.LITERAL for item_op, _ in av):
+            char_classes.append(frozenset(chr(c).casefold() for _, c in av))
+        runs.append(current)
+        current = ""
+    runs.append(current)
+
+    longest = max(runs, key=len)
+    if longest:
+        return longest.casefold()
+    if char_classes:
+        return min(char_classes, key=len)
+    return None
+
+
+def _references_groups(nodes) -> bool:
+    for op, av in nodes:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return True
+        for item in av if isinstance(av, (tuple, list)) else (av,):
+            if isinstance(item, sre_parse.SubPattern) and _references_groups(item):
+                return True
+            if isinstance(item, (tuple, list)) and any(
+                isinstance(sub, sre_parse.SubPattern) and _references_groups(sub) for sub in item
+            ):
+                return True
+    return False
+
+
+def is_combinable(pattern: str, flags: int = 0) -> bool:
+    """
+    Check whether a pattern keeps its meaning inside the combined alternation.
+
+    Inline global flags ("(?i)...") are only valid at the start of the whole
+    expression, a named group may appear only once in it, and numbered
+    backreferences ("\\1") point at a different group once the pattern is
+    wrapped and preceded by other rules. Such patterns are scanned on their
+    own instead.
+
+    Args:
+        pattern: The regex pattern
+        flags: Flags the pattern will be compiled with
+
+    Returns:
+        True if the pattern can be joined into the combined alternation
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+        # Parsed without flags so inline ones show up even if already set
+        inline_flags = sre_parse.parse(pattern).state.flags & ~sre_parse.parse("").state.flags
+    except re.error:
+        return False
+    if inline_flags:
+        return False
+    if parsed.state.groupdict:
+        return False
+    return not _references_groups(parsed)
+
+
+class InjectionRuleEngine:
+    """
+    Compiled matcher for an ordered set of injection patterns.
+
+    Each pattern is compiled once together with a literal prefilter trigger.
+    A text is first checked for the triggers with plain substring/character
+    lookups, which is enough to clear the common clean case (trail ids,
+    locations) without running any regex. Non-ASCII text skips the
+    prefilter. When many rules remain candidates, they are evaluated with a
+    single combined alternation (one named group per rule); otherwise the
+    few candidates are checked individually. Rules that cannot be joined
+    into the alternation (see is_combinable) are always checked
+    individually.
+    Priority order is preserved in both cases: the reported rule is always
+    the first one (in dictionary order) that matches.
+
+    Patterns are compiled with the engine from regex_engine (built-in re by
+    default, RE2 or the time-limited regex module when configured).
+    """
+
+    FLAGS = re.IGNORECASE | re.MULTILINE
+
+    # Above this many candidate rules the combined alternation is cheaper
+    # than searching each candidate separately.
+    COMBINED_SCAN_THRESHOLD = 4
+
+    def __init__(self, patterns: dict[str, list[tuple[str, str]]], engine: str | None = None):
+        self.rules: list[CompiledRule] = []
+        for category, rules in patterns.items():
+            for pattern, description in rules:
+                try:
+                    regex = compile_pattern(pattern, self.FLAGS, engine)
+                except re.error as e:
+                    # Skip invalid regex patterns
+                    logger.warning(f"Skipping invalid injection pattern {pattern!r}: {e}")
+                    continue
+                trigger = derive_trigger(pattern, self.FLAGS)
+                self.rules.append(CompiledRule(category, description, pattern, regex, trigger))
+
+        self._isolated = {i for i, rule in enumerate(self.rules) if not is_combinable(rule.pattern, self.FLAGS)}
+        self.combined: re.Pattern | None = None
+        if len(self._isolated) < len(self.rules):
+            self.combined = compile_pattern(
+                "|".join(
+                    f"(?P<r{i}>{rule.pattern})" for i, rule in enumerate(self.rules) if i not in self._isolated
+                ),
+                self.FLAGS,
+                engine
+            )
+
+        # Group rules by trigger so each literal is looked up once per text
+        self._always: list[int] = []
+        self._literal_triggers: dict[str, list[int]] = {}
+        self._charset_triggers: dict[frozenset[str], list[int]] = {}
+        for i, rule in enumerate(self.rules):
+            if rule.trigger is None:
+                self._always.append(i)
+            elif isinstance(rule.trigger, str):
+                self._literal_triggers.setdefault(rule.trigger, []).append(i)
+            else:
+                self._charset_triggers.setdefault(rule.trigger, []).append(i)
+
+    def candidates(self, text: str) -> list[int]:
+        """
+        Return indexes of rules that could possibly match text, in priority order.
+
+        Args:
+            text: The text to prefilter
+
+        Returns:
+            Sorted list of rule indexes whose trigger is present in text
+        """
+        # Case-insensitive regex matching folds some non-ASCII characters
+        # (e.g. dotted capital I) in ways str.casefold() does not, so the
+        # literal prefilter is only trusted for ASCII text.
+        if not text.isascii():
+            return list(range(len(self.rules)))
+
+        folded = text.casefold()
+        hits = list(self._always)
+        for literal, indexes in self._literal_triggers.items():
+            if literal in folded:
+                hits.extend(indexes)
+        if self._charset_triggers:
+            chars = set(folded)
+            for charset, indexes in self._charset_triggers.items():
+                if not charset.isdisjoint(chars):
+                    hits.extend(indexes)
+        hits.sort()
+        return hits
+
+    def first_match(self, text: str) -> CompiledRule | None:
+        """
+        Return the highest-priority rule matching text, or None if clean.
+
+        Args:
+            text: The text to scan
+
+        Returns:
+            The first matching CompiledRule in priority order, or None
+
+        Raises:
+            RegexTimeoutError: If a match exceeds the configured time limit
+        """
+        candidates = self.candidates(text)
+        if not candidates:
+            return None
+
+        if len(candidates) <= self.COMBINED_SCAN_THRESHOLD or self.combined is None:
+            for i in candidates:
+                if self.rules[i].regex.search(text):
+                    return self.rules[i]
+            return None
+
+        match = self.combined.search(text)
+        hit = int(match.lastgroup[1:]) if match is not None else len(self.rules)
+        # The combined scan reports the leftmost match; an earlier rule may
+        # still match further along the text, so confirm priority. Without a
+        # combined match only the isolated rules can still match.
+        for i in candidates:
+            if i >= hit:
+                break
+            if (match is not None or i in self._isolated) and self.rules[i].regex.search(text):
+                return self.rules[i]
+        return self.rules[hit] if match is not None else None
+
+
+# URL-decode/escape-decode rounds before giving up on nested encodings
+MAX_DECODE_PASSES = 3
+
+# Canonical forms are cached for texts up to this length (typical tool
+# arguments); larger texts are normalized on every call
+NORMALIZATION_CACHE_SIZE = 4096
+NORMALIZATION_CACHE_MAX_CHARS = 4096
+
+_ESCAPE_SEQUENCE = re.compile(r"\\(?:x([0-9a-fA-F]{2})|u([0-9a-fA-F]{4}))")
+
+
+def _decode_escape(match: re.Match) -> str:
+    return chr(int(match.group(1) or match.group(2), 16))
+
+
+def _normalize(text: str) -> str:
+    for _ in range(MAX_DECODE_PASSES):
+        decoded = text
+        if "%" in decoded:
+            decoded = unquote(decoded)
+        if "\\" in decoded:
+            decoded = _ESCAPE_SEQUENCE.sub(_decode_escape, decoded)
+        if decoded == text:
+            break
+        text = decoded
+
+    if not text.isascii():
+        # Compatibility folding (fullwidth, ligatures...) and removal of
+        # combining marks so e.g. dotted capital I folds to a plain "i"
+        text = unicodedata.normalize("NFKC", text)
+        text = "".join(
+            c for c in unicodedata.normalize("NFD", text.casefold())
+            if not unicodedata.combining(c)
+        )
+    return text.casefold()
+
+
+_normalize_cached = functools.lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)(_normalize)
+
+
+def normalize_for_matching(text: str) -> str:
+    """
+    Reduce text to the canonical form the injection patterns are matched on.
+
+    Applies, in order: URL-decoding and \\xNN/\\uNNNN escape decoding
+    (repeated until stable, at most MAX_DECODE_PASSES times), NFKC unicode
+    folding with combining marks removed, and case folding. Encoded variants
+    such as "%2e%2e%2f" or "%252e%252e" therefore reach the same plain rule
+    as "../" instead of needing a rule each.
+
+    Args:
+        text: The raw text
+
+    Returns:
+        The canonical form (cached for short texts)
+    """
+    if len(text) <= NORMALIZATION_CACHE_MAX_CHARS:
+        return _normalize_cached(text)
+    return _normalize(text)
+
+
+
 def check_patterns(text: str) -> DetectionResult:
     """
     Check text against regex injection patterns.
-    Fast check for known patterns - runs in <1ms.
+    Fast check for known patterns - a single compiled scan of the canonical
+    form (see normalize_for_matching) for clean text. Patterns come from the
+    active rule pack (the INJECTION_PATTERNS above unless RULE_PACK_PATH is set).
     
     Args:
         text: The text to check for injection patterns
@@ -109,40 +435,101 @@ def check_patterns(text: str) -> DetectionResult:
     if not text:
         return DetectionResult(is_safe=True, category="", reason="")
     
-    for category, patterns in INJECTION_PATTERNS.items():
-        for pattern, description in patterns:
-            try:
-                if re.search(pattern, text, re.IGNORECASE | re.MULTILINE):
-                    return DetectionResult(
-                        is_safe=False,
-                        category=category,
-                        reason=description
-                    )
-            except re.error:
-                # Skip invalid regex patterns
-                continue
+    try:
+        rule = get_active_rule_pack().injection_engine.first_match(normalize_for_matching(text))
+    except RegexTimeoutError as e:
+        # Input that makes a pattern run over its time limit is treated as
+        # hostile: fail closed rather than let it through unscanned.
+        logger.warning(f"Injection scan timed out: {e}")
+        return DetectionResult(
+            is_safe=False,
+            category="regex_timeout",
+            reason="Input exceeded the pattern matching time limit"
+        )
+    if rule is not None:
+        return DetectionResult(
+            is_safe=False,
+            category=rule.category,
+            reason=rule.description
+        )
+    
+    return DetectionResult(is_safe=True, category="", reason="")
+
+
+def parse_shield_prompt_response(result: dict) -> DetectionResult:
+    """
+    Convert a text:shieldPrompt response body into a DetectionResult.
     
+    Args:
+        result: Parsed JSON response from Prompt Shields
+        
+    Returns:
+        DetectionResult indicating if attack was detected
+    """
+    # Check for attacks in user prompt
+    user_analysis = result.get("userPromptAnalysis", {})
+    if user_analysis.get("attackDetected"):
+        return DetectionResult(
+            is_safe=False,
+            category="prompt_injection",
+            reason="Prompt Shield detected jailbreak attack"
+        )
+    
+    # Check for attacks in documents
+    docs_analysis = result.get("documentsAnalysis", [])
+    for doc in docs_analysis:
+        if doc.get("attackDetected"):
+            return DetectionResult(
+                is_safe=False,
+                category="prompt_injection",
+                reason="Prompt Shield detected document attack"
+            )
+    
+    return DetectionResult(is_safe=True, category="", reason="")
+
+
+def prompt_shields_unavailable(breaker: CircuitBreaker) -> DetectionResult:
+    """
+    Result to use when Prompt Shields could not give a verdict.
+    
+    Fails open by default so requests are not blocked while the service is
+    unavailable; PROMPT_SHIELDS_FAIL_MODE=closed blocks them instead.
+    """
+    if breaker.fail_closed:
+        return DetectionResult(
+            is_safe=False,
+            category="service_unavailable",
+            reason="Prompt Shields unavailable, failing closed"
+        )
     return DetectionResult(is_safe=True, category="", reason="")
 
 
-async def check_with_prompt_shields(texts: list[str]) -> DetectionResult:
+async def check_with_prompt_shields(texts: list[str], deadline: Deadline | None = None) -> DetectionResult:
     """
     Check texts using Azure AI Content Safety Prompt Shields.
     Detects sophisticated prompt injection and jailbreak attempts.
     
     Uses managed identity for authentication via REST API.
     The Python SDK 1.0.0 doesn't include Prompt Shields, so we call
-    the REST API directly with aiohttp.
+    the REST API directly through the shared PromptShieldsClient, which
+    reuses one pooled session and a cached token across requests.
+    Verdicts are cached by prompt hash, so repeated arguments skip the call.
+    Texts beyond the user prompt limit are sent as documents, chunked to the
+    service limits, using the fewest concurrent requests possible.
+    
+    Calls are bounded by the request deadline and guarded by a circuit
+    breaker; timeouts and errors count as failures, and while the circuit
+    is open the call is skipped entirely.
     
     Args:
         texts: List of text strings to analyze
+        deadline: Request time budget; defaults to a fresh budget
         
     Returns:
         DetectionResult indicating if attack was detected
     """
-    # Prompt Shields requires the Content Safety endpoint, not the generic AI Services endpoint
-    endpoint = os.environ.get("CONTENT_SAFETY_ENDPOINT")
-    if not endpoint:
+    client = get_prompt_shields_client()
+    if client is None:
         logger.warning("CONTENT_SAFETY_ENDPOINT not configured, skipping Prompt Shields")
         return DetectionResult(is_safe=True, category="", reason="")
     
@@ -152,111 +539,513 @@ async def check_with_prompt_shields(texts: list[str]) -> DetectionResult:
     if not user_prompt.strip():
         return DetectionResult(is_safe=True, category="", reason="")
     
+    cache = get_verdict_cache()
+    cache_key = prompt_cache_key(user_prompt) if cache is not None else ""
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    if deadline is None:
+        deadline = Deadline.for_request()
+    breaker = get_circuit_breaker("prompt_shields", "PROMPT_SHIELDS_FAIL_MODE")
+    
+    if deadline.expired:
+        logger.warning("Request deadline exhausted before Prompt Shields call")
+        return prompt_shields_unavailable(breaker)
+    if not breaker.allow_request(deadline.correlation_id):
+        logger.warning("Prompt Shields circuit open, skipping call")
+        return prompt_shields_unavailable(breaker)
+    
     try:
-        # Get token using managed identity
-        async with DefaultAzureCredential() as credential:
-            token = await credential.get_token("https://cognitiveservices.azure.com/.default")
-            
-            # Construct the API URL
-            # Remove trailing slash if present
-            base_url = endpoint.rstrip('/')
-            api_url = f"{base_url}/contentsafety/text:shieldPrompt?api-version=2024-09-01"
-            
-            # Prepare the request body
-            request_body = {
-                "userPrompt": user_prompt,
-                "documents": []
-            }
-            
-            headers = {
-                "Authorization": f"Bearer {token.token}",
-                "Content-Type": "application/json"
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(api_url, json=request_body, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        
-                        # Check for attacks in user prompt
-                        user_analysis = result.get("userPromptAnalysis", {})
-                        if user_analysis.get("attackDetected"):
-                            return DetectionResult(
-                                is_safe=False,
-                                category="prompt_injection",
-                                reason="Prompt Shield detected jailbreak attack"
-                            )
-                        
-                        # Check for attacks in documents
-                        docs_analysis = result.get("documentsAnalysis", [])
-                        for doc in docs_analysis:
-                            if doc.get("attackDetected"):
-                                return DetectionResult(
-                                    is_safe=False,
-                                    category="prompt_injection",
-                                    reason="Prompt Shield detected document attack"
-                                )
-                        
-                        return DetectionResult(is_safe=True, category="", reason="")
-                    else:
-                        error_text = await response.text()
-                        logger.warning(f"Prompt Shields API returned {response.status}: {error_text}")
-                        return DetectionResult(is_safe=True, category="", reason="")
+        # Large bodies are spread over document slots and, if needed, several
+        # concurrent requests so nothing exceeds the service limits
+        requests = plan_shield_prompt_requests(texts)
+        timeout = deadline.remaining()
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                *(client.shield_prompt(r.user_prompt, r.documents, timeout=timeout) for r in requests)
+            ),
+            timeout=timeout
+        )
+        breaker.record_success(deadline.correlation_id)
+        
+        verdict = DetectionResult(is_safe=True, category="", reason="")
+        for result in results:
+            verdict = parse_shield_prompt_response(result)
+            if not verdict.is_safe:
+                break
+        
+        # Only real API verdicts are cached - fail-open results below are not
+        if cache is not None:
+            cache.put(cache_key, verdict)
+        return verdict
+    
+    except PromptShieldsError as e:
+        logger.warning(str(e))
+        # Throttling and server errors mean the dependency is unhealthy;
+        # other 4xx responses mean it answered and is up
+        if e.status == 429 or e.status >= 500:
+            breaker.record_failure(deadline.correlation_id)
+        else:
+            breaker.record_success(deadline.correlation_id)
+        return prompt_shields_unavailable(breaker)
+    
+    except asyncio.TimeoutError:
+        logger.warning("Prompt Shields call exceeded the request deadline")
+        breaker.record_failure(deadline.correlation_id)
+        return prompt_shields_unavailable(breaker)
+
+    except asyncio.CancelledError:
+        # Not an outcome for the breaker, but a half-open trial must not stay
+        # reserved by a call that will never report back
+        breaker.release_trial()
+        raise
                 
     except Exception as e:
         logger.warning(f"Prompt Shields check failed: {e}")
-        # Fail open - don't block requests if service is unavailable
+        breaker.record_failure(deadline.correlation_id)
+        # Fail open (by default) - don't block requests if service is unavailable
+        return prompt_shields_unavailable(breaker)
+
+
+# Local prompt-injection risk features: (pattern, weight, name). Matched on
+# the canonical (normalized, casefolded) text, so patterns are lowercase.
+PROMPT_RISK_FEATURES: list[tuple[str, float, str]] = [
+    (r"\b(ignore|disregard|forget|override)\b.{0,40}\b(previous|prior|above|earlier|all|your|the)\b"
+     r".{0,20}\b(instructions?|rules|prompts?|guidelines|directions)\b",
+     0.7, "instruction_override"),
+    (r"^\s*(system|assistant|user|developer)\s*:|<\|im_start\|>|\[/?inst\]|###\s*(instruction|system)",
+     0.5, "role_marker"),
+    (r"\byou are (now|no longer)\b|\bact as\b|\bpretend (to be|you)\b|\broleplay\b",
+     0.4, "persona_switch"),
+    (r"\b(jailbreak|dan mode|developer mode|do anything now)\b",
+     0.6, "jailbreak_term"),
+    (r"\b(reveal|print|show|repeat|output|list|summari[sz]e|dump)\b.{0,40}"
+     r"\b(system prompt|instructions|secrets?|passwords?|api keys?|ssns?|credentials|tokens?)\b",
+     0.5, "exfiltration"),
+    (r"\b(do not|don't|never)\b.{0,20}\b(tell|mention|reveal|inform)\b",
+     0.3, "concealment"),
+    (r"\b(then|and then|also|after that|instead)\b.{0,40}\b(send|email|post|upload|delete|summari[sz]e|forward)\b",
+     0.3, "chained_instruction"),
+]
+
+# Long free text is where indirect injection hides
+LONG_TEXT_CHARS = 200
+LONG_TEXT_WEIGHT = 0.2
+
+DEFAULT_RISK_THRESHOLD = 0.3
+
+_risk_features = [
+    (compile_pattern(pattern, re.MULTILINE), weight, name)
+    for pattern, weight, name in PROMPT_RISK_FEATURES
+]
+
+
+def score_prompt_risk(texts: list[str]) -> float:
+    """
+    Score how likely texts are to carry prompt injection, without a network call.
+
+    Sums the weights of matched PROMPT_RISK_FEATURES (each counted once)
+    plus LONG_TEXT_WEIGHT for long free text, capped at 1.0.
+
+    Args:
+        texts: Texts extracted from an MCP request
+
+    Returns:
+        Risk score between 0.0 and 1.0
+    """
+    canonical = "\n".join(normalize_for_matching(text) for text in texts)
+    score = LONG_TEXT_WEIGHT if max(map(len, texts), default=0) >= LONG_TEXT_CHARS else 0.0
+    for regex, weight, _ in _risk_features:
+        try:
+            if regex.search(canonical):
+                score += weight
+        except RegexTimeoutError:
+            # Too expensive to score: treat as risky so Prompt Shields runs
+            return 1.0
+    return min(score, 1.0)
+
+
+class RiskGateMode:
+    """Constants for the Prompt Shields risk gate modes."""
+    OFF = "off"
+    SHADOW = "shadow"
+    ENFORCE = "enforce"
+
+
+class PromptRiskGate:
+    """
+    Decides whether a request's risk score justifies a Prompt Shields call.
+
+    - enforce: requests scoring below threshold skip Prompt Shields
+    - shadow: Prompt Shields is always called; detections on requests the
+      gate would have skipped are logged as RISK_GATE_SHADOW_MISS
+    """
+
+    def __init__(self, threshold: float = DEFAULT_RISK_THRESHOLD, mode: str = RiskGateMode.SHADOW):
+        self.threshold = threshold
+        self.mode = mode
+        self.evaluated = 0
+        self.would_skip = 0
+        self.missed_attacks = 0
+
+    def should_call(self, score: float) -> bool:
+        """Count a decision and return whether Prompt Shields should run."""
+        self.evaluated += 1
+        if score >= self.threshold:
+            return True
+        self.would_skip += 1
+        return self.mode != RiskGateMode.ENFORCE
+
+    def record_verdict(self, score: float, result: DetectionResult, correlation_id: str = "") -> None:
+        """In shadow mode, log detections the gate would have skipped."""
+        if self.mode != RiskGateMode.SHADOW or score >= self.threshold:
+            return
+        if result.is_safe or result.category != "prompt_injection":
+            return
+        self.missed_attacks += 1
+        log_risk_gate_shadow_miss(
+            score=score,
+            threshold=self.threshold,
+            gate_stats=self.stats(),
+            correlation_id=correlation_id
+        )
+
+    def stats(self) -> dict[str, int]:
+        """Return gate counters for telemetry."""
+        return {
+            "evaluated": self.evaluated,
+            "would_skip": self.would_skip,
+            "missed_attacks": self.missed_attacks,
+        }
+
+
+_risk_gate: PromptRiskGate | None = None
+
+
+def get_prompt_risk_gate() -> PromptRiskGate | None:
+    """
+    Get the process-wide risk gate.
+
+    Configured from PROMPT_RISK_GATE_MODE (off, shadow, enforce; default
+    shadow) and PROMPT_RISK_THRESHOLD on first use.
+
+    Returns:
+        PromptRiskGate or None when the gate is off
+    """
+    global _risk_gate
+
+    if _risk_gate is None:
+        mode = os.environ.get("PROMPT_RISK_GATE_MODE", RiskGateMode.SHADOW).lower()
+        if mode not in (RiskGateMode.SHADOW, RiskGateMode.ENFORCE):
+            return None
+        _risk_gate = PromptRiskGate(
+            threshold=float(os.environ.get("PROMPT_RISK_THRESHOLD", DEFAULT_RISK_THRESHOLD)),
+            mode=mode
+        )
+    return _risk_gate
+
+
+def uncleared_texts(texts: list[str], gateway_cleared: frozenset[str]) -> list[str]:
+    """Drop the texts the gateway already cleared with Prompt Shields."""
+    if not gateway_cleared:
+        return texts
+    remaining = [text for text in texts if text not in gateway_cleared]
+    if len(remaining) < len(texts):
+        logger.info(f"Prompt Shields already cleared {len(texts) - len(remaining)} text(s) at the gateway")
+    return remaining
+
+
+async def gated_prompt_shields(texts: list[str], deadline: Deadline | None = None) -> DetectionResult:
+    """
+    Call Prompt Shields unless the local risk gate rules the texts out.
+
+    Args:
+        texts: List of texts to analyze
+        deadline: Request time budget for the outbound call
+
+    Returns:
+        DetectionResult from Prompt Shields, or safe when the gate skipped it
+    """
+    gate = get_prompt_risk_gate()
+    if gate is None:
+        return await check_with_prompt_shields(texts, deadline)
+
+    score = score_prompt_risk(texts)
+    if not gate.should_call(score):
+        logger.info(f"Risk score {score:.2f} below {gate.threshold}, skipping Prompt Shields")
         return DetectionResult(is_safe=True, category="", reason="")
 
+    result = await check_with_prompt_shields(texts, deadline)
+    gate.record_verdict(score, result, deadline.correlation_id if deadline else "")
+    return result
 
-def extract_texts_from_mcp_request(body: dict) -> list[str]:
+
+class ExtractedText(NamedTuple):
+    """A string found in an MCP request, with its JSON path."""
+    path: str
+    text: str
+
+
+class ExtractionLimitError(ValueError):
+    """Raised when request arguments exceed the nesting or size limits."""
+
+
+# Extraction limits (overridable via app settings). Bodies beyond these
+# cannot be fully scanned, so they are rejected rather than passed.
+DEFAULT_MAX_ARGUMENT_DEPTH = 32
+DEFAULT_MAX_EXTRACTED_CHARS = 1_000_000
+
+
+def json_path(parent: str, key: str | int) -> str:
+    """Append an object key or array index to a JSON path."""
+    if isinstance(key, int):
+        return f"{parent}[{key}]"
+    if key.isidentifier():
+        return f"{parent}.{key}"
+    return f"{parent}[{key!r}]"
+
+
+def iter_argument_texts(
+    value,
+    path: str,
+    depth: int,
+    max_depth: int,
+    schema: ArgumentSchema | None = None
+) -> Iterator[ExtractedText]:
     """
-    Extract text content from an MCP request body.
+    Walk a nested argument value and yield its string leaves.
+    
+    Numbers, booleans and nulls cannot carry injection text and are skipped.
+    Keys of nested objects are yielded too: they are free-form text that
+    used to reach the scanner through the value's repr. With a schema,
+    strings it clears (enum members, strict patterns) and property names it
+    declares are skipped as well.
+    
+    Raises:
+        ExtractionLimitError: If nesting exceeds max_depth
+    """
+    if isinstance(value, str):
+        if schema is None or not schema.clears(value):
+            yield ExtractedText(path, value)
+        return
+    if depth >= max_depth:
+        raise ExtractionLimitError(f"Arguments nested deeper than {max_depth} levels")
+    if isinstance(value, dict):
+        properties = schema.properties if schema is not None else {}
+        for key, item in value.items():
+            key = str(key)
+            if key not in properties:
+                # "~" marks the property name itself (JSONPath-Plus style)
+                yield ExtractedText(f"{json_path(path, key)}~", key)
+            yield from iter_argument_texts(item, json_path(path, key), depth + 1, max_depth, properties.get(key))
+    elif isinstance(value, list):
+        items = schema.items if schema is not None else None
+        for index, item in enumerate(value):
+            yield from iter_argument_texts(item, json_path(path, index), depth + 1, max_depth, items)
+
+
+def iter_mcp_texts(
+    body: dict,
+    max_depth: int | None = None,
+    max_chars: int | None = None
+) -> Iterator[ExtractedText]:
+    """
+    Lazily extract text content from an MCP request body.
     
     Extracts from:
-    - Tool arguments
+    - Tool arguments (string leaves of nested objects/arrays)
     - Resource URIs
     - Prompt content/messages
+    - Tool name
+    
+    Being a generator, callers can stop at the first text that fails a
+    check without walking (or copying) the rest of the body. Arguments of
+    tools with a known input schema (see tool_schemas) that the schema
+    proves harmless are not yielded, so they skip every detection layer.
+    
+    Args:
+        body: Parsed JSON body of MCP request
+        max_depth: Maximum argument nesting (MCP_MAX_ARGUMENT_DEPTH)
+        max_chars: Maximum total extracted characters (MCP_MAX_EXTRACTED_CHARS)
+        
+    Yields:
+        ExtractedText with the JSON path and the string found there
+        
+    Raises:
+        ExtractionLimitError: If the body exceeds the depth or size limits
+    """
+    if max_depth is None:
+        max_depth = int(os.environ.get("MCP_MAX_ARGUMENT_DEPTH", DEFAULT_MAX_ARGUMENT_DEPTH))
+    if max_chars is None:
+        max_chars = int(os.environ.get("MCP_MAX_EXTRACTED_CHARS", DEFAULT_MAX_EXTRACTED_CHARS))
+    
+    def leaves() -> Iterator[ExtractedText]:
+        params = body.get("params", {})
+        if not isinstance(params, dict):
+            return
+        
+        # Extract from params.arguments (tool calls)
+        arguments = params.get("arguments", {})
+        if isinstance(arguments, dict):
+            schema = get_arguments_schema(body)
+            properties = schema.properties if schema is not None else {}
+            for key, value in arguments.items():
+                yield from iter_argument_texts(
+                    value, json_path("$.params.arguments", str(key)), 1, max_depth, properties.get(str(key))
+                )
+        elif isinstance(arguments, str):
+            yield ExtractedText("$.params.arguments", arguments)
+        
+        # Extract from params.uri (resource requests)
+        uri = params.get("uri", "")
+        if uri and isinstance(uri, str):
+            yield ExtractedText("$.params.uri", uri)
+        
+        # Extract from params.messages (prompt content)
+        messages = params.get("messages", [])
+        if isinstance(messages, list):
+            for i, msg in enumerate(messages):
+                if not isinstance(msg, dict):
+                    continue
+                content = msg.get("content", "")
+                path = f"$.params.messages[{i}].content"
+                if isinstance(content, str):
+                    yield ExtractedText(path, content)
+                elif isinstance(content, list):
+                    for j, item in enumerate(content):
+                        if isinstance(item, dict) and isinstance(item.get("text"), str):
+                            yield ExtractedText(f"{path}[{j}].text", item["text"])
+        
+        # Extract tool name (could contain injection)
+        tool_name = params.get("name", "")
+        if tool_name and isinstance(tool_name, str):
+            yield ExtractedText("$.params.name", tool_name)
+    
+    total_chars = 0
+    for extracted in leaves():
+        total_chars += len(extracted.text)
+        if total_chars > max_chars:
+            raise ExtractionLimitError(f"Request text exceeds {max_chars} characters")
+        yield extracted
+
+
+def extract_texts_from_mcp_request(body: dict) -> list[str]:
+    """
+    Extract text content from an MCP request body.
+    
+    See iter_mcp_texts for what is extracted; this materializes the texts
+    for callers that need all of them (e.g. the Prompt Shields layer).
     
     Args:
         body: Parsed JSON body of MCP request
         
     Returns:
         List of text strings to check
+        
+    Raises:
+        ExtractionLimitError: If the body exceeds the depth or size limits
     """
-    texts_to_check = []
-    
-    # Extract from params.arguments (tool calls)
-    params = body.get("params", {})
-    arguments = params.get("arguments", {})
-    if isinstance(arguments, dict):
-        texts_to_check.extend(str(v) for v in arguments.values())
-    elif isinstance(arguments, str):
-        texts_to_check.append(arguments)
-    
-    # Extract from params.uri (resource requests)
-    uri = params.get("uri", "")
-    if uri:
-        texts_to_check.append(uri)
-    
-    # Extract from params.messages (prompt content)
-    messages = params.get("messages", [])
-    for msg in messages:
-        if isinstance(msg, dict):
-            content = msg.get("content", "")
-            if isinstance(content, str):
-                texts_to_check.append(content)
-            elif isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict) and "text" in item:
-                        texts_to_check.append(item["text"])
-    
-    # Extract tool name (could contain injection)
-    tool_name = params.get("name", "")
-    if tool_name:
-        texts_to_check.append(tool_name)
-    
-    return texts_to_check
+    return [extracted.text for extracted in iter_mcp_texts(body)]
+
+
+def extraction_limit_result(error: ExtractionLimitError) -> DetectionResult:
+    """Block requests that are too deep or too large to scan completely."""
+    return DetectionResult(is_safe=False, category="invalid_request", reason=str(error))
+
+
+def check_texts(texts: Iterable[str]) -> DetectionResult:
+    """
+    Check texts against regex patterns, stopping at the first hit.
+    
+    Args:
+        texts: Texts extracted from an MCP request
+        
+    Returns:
+        DetectionResult for the first unsafe text, or a safe result
+    """
+    for text in texts:
+        result = check_patterns(text)
+        if not result.is_safe:
+            return result
+    
+    return DetectionResult(is_safe=True, category="", reason="")
+
+
+def scan_mcp_request(body: dict) -> tuple[DetectionResult, list[str]]:
+    """
+    Regex-check an MCP request while extracting its texts.
+    
+    Stops walking the body at the first regex hit, so oversized or deeply
+    nested bodies with an early injection are rejected cheaply.
+    
+    Args:
+        body: Parsed JSON body of MCP request
+        
+    Returns:
+        Tuple of (regex result, texts extracted so far)
+    """
+    texts: list[str] = []
+    try:
+        for extracted in iter_mcp_texts(body):
+            result = check_patterns(extracted.text)
+            if not result.is_safe:
+                logger.info(f"Regex detected at {extracted.path}: {result.category}")
+                return result, texts
+            texts.append(extracted.text)
+    except ExtractionLimitError as e:
+        return extraction_limit_result(e), texts
+    
+    return DetectionResult(is_safe=True, category="", reason=""), texts
+
+
+async def scan_mcp_request_async(body: dict) -> tuple[DetectionResult, list[str]]:
+    """
+    Regex-check an MCP request without blocking the event loop on large bodies.
+    
+    Texts are scanned inline while the extracted total stays below
+    OFFLOAD_THRESHOLD_BYTES (stopping at the first hit, like
+    scan_mcp_request); once a body crosses the threshold, the remaining
+    texts are scanned in the process pool (see offload).
+    
+    Args:
+        body: Parsed JSON body of MCP request
+        
+    Returns:
+        Tuple of (regex result, texts extracted)
+    """
+    threshold = offload_threshold()
+    texts: list[str] = []
+    total_chars = 0
+    scanned = 0
+    try:
+        for extracted in iter_mcp_texts(body):
+            total_chars += len(extracted.text)
+            if total_chars < threshold:
+                result = check_patterns(extracted.text)
+                if not result.is_safe:
+                    logger.info(f"Regex detected at {extracted.path}: {result.category}")
+                    return result, texts
+                texts.append(extracted.text)
+                scanned = len(texts)
+            else:
+                texts.append(extracted.text)
+    except ExtractionLimitError as e:
+        return extraction_limit_result(e), texts
+    
+    if scanned < len(texts):
+        result = await run_scan(check_texts, texts[scanned:], size=total_chars)
+        if not result.is_safe:
+            logger.info(f"Regex detected in offloaded scan: {result.category}")
+            return result, texts
+    
+    return DetectionResult(is_safe=True, category="", reason=""), texts
+
+
+def speculative_prompt_shields_enabled() -> bool:
+    """Whether Prompt Shields should start concurrently with the regex layer."""
+    return os.environ.get("PROMPT_SHIELDS_SPECULATIVE", "false").lower() == "true"
 
 
 def check_mcp_request(body: dict) -> DetectionResult:
@@ -270,42 +1059,275 @@ def check_mcp_request(body: dict) -> DetectionResult:
     Returns:
         DetectionResult indicating safety
     """
-    texts_to_check = extract_texts_from_mcp_request(body)
+    result, _ = scan_mcp_request(body)
+    return result
+
+
+# Verdicts caused by dependency health or load rather than by the payload
+# itself (regex timeouts are wall-clock limits that CPU contention can hit)
+TRANSIENT_CATEGORIES = {"service_unavailable", "regex_timeout"}
+
+
+def known_bad_digest(method, tool, texts: list[str]) -> bytes:
+    """
+    Hash what the detection layers see of a request, for the known-bad set.
+
+    Only the method, tool name and extracted texts are hashed, so replays
+    with fresh JSON-RPC ids (or reordered keys, whitespace...) hash the
+    same, and the texts are normalized like scanned text. Module-level so
+    large requests can be hashed in the scanning process pool.
+
+    Args:
+        method: JSON-RPC method
+        tool: Tool name for tools/call, else None
+        texts: Texts extracted by iter_mcp_texts
+
+    Returns:
+        SHA-256 digest of the normalized payload
+    """
+    normalized = [normalize_for_matching(text) for text in texts]
+    canonical = json.dumps([method, tool, normalized], ensure_ascii=False, separators=(",", ":"))
+    return payload_digest(canonical)
+
+
+async def lookup_known_bad(body: dict) -> tuple[DetectionResult | None, bytes | None]:
+    """
+    Look a request up in the known-bad payload set.
+
+    The extraction limits are enforced before anything is hashed: a body
+    over MCP_MAX_EXTRACTED_CHARS or MCP_MAX_ARGUMENT_DEPTH is rejected
+    with its invalid_request verdict (which is not remembered), and bodies
+    above OFFLOAD_THRESHOLD_BYTES are hashed in the process pool.
+
+    Args:
+        body: Parsed JSON body of MCP request
+
+    Returns:
+        Tuple of (verdict to return immediately or None, digest to remember
+        a new verdict under, or None when the set is disabled)
+    """
+    known_bad = get_known_bad_payloads()
+    if known_bad is None:
+        return None, None
+    try:
+        texts = [extracted.text for extracted in iter_mcp_texts(body)]
+    except ExtractionLimitError as e:
+        return extraction_limit_result(e), None
+
+    params = body.get("params")
+    tool = params.get("name") if isinstance(params, dict) else None
+    size = sum(len(text) for text in texts)
+    digest = await run_scan(known_bad_digest, body.get("method"), tool, texts, size=size)
+    verdict = known_bad.get(digest, get_active_rule_pack().version)
+    if verdict is not None:
+        logger.info(f"Known-bad payload replayed: {verdict.category}")
+    return verdict, digest
+
+
+def remember_blocked(digest: bytes | None, result: DetectionResult) -> None:
+    """Add a blocked verdict to the known-bad set (transient blocks excluded)."""
+    if digest is None or result.is_safe or result.category in TRANSIENT_CATEGORIES:
+        return
+    known_bad = get_known_bad_payloads()
+    if known_bad is not None:
+        known_bad.add(digest, result, get_active_rule_pack().version)
+
+
+async def check_mcp_request_async(
+    body: dict,
+    gateway_cleared: frozenset[str] = frozenset(),
+    speculative: bool | None = None,
+    deadline: Deadline | None = None
+) -> DetectionResult:
+    """
+    Hybrid check of MCP request:
+    0. Known-bad payload set (replays of previously blocked requests)
+    1. Fast regex check first (catches 80% of attacks instantly)
+    2. Prompt Shields API for sophisticated attacks (AI-powered)
     
-    # Check all extracted text against regex patterns
-    for text in texts_to_check:
-        result = check_patterns(text)
-        if not result.is_safe:
-            return result
+    Blocked verdicts are added to the known-bad set, so replays of the
+    same payload are rejected before layer 1 runs.
     
-    return DetectionResult(is_safe=True, category="", reason="")
+    Args:
+        body: Parsed JSON body of MCP request
+        gateway_cleared: Texts the gateway already cleared with Prompt
+            Shields (see prompt_shields.gateway_cleared_texts); layer 2
+            runs on the rest
+        speculative: Run both layers concurrently; defaults to the
+            PROMPT_SHIELDS_SPECULATIVE app setting
+        deadline: Request time budget for outbound calls
+        
+    Returns:
+        DetectionResult indicating safety
+    """
+    known, digest = await lookup_known_bad(body)
+    if known is not None:
+        return known
+    result = await _check_mcp_request_layers(body, gateway_cleared, speculative, deadline)
+    remember_blocked(digest, result)
+    return result
 
 
-async def check_mcp_request_async(body: dict) -> DetectionResult:
+async def _check_mcp_request_layers(
+    body: dict,
+    gateway_cleared: frozenset[str] = frozenset(),
+    speculative: bool | None = None,
+    deadline: Deadline | None = None
+) -> DetectionResult:
     """
     Hybrid check of MCP request:
     1. Fast regex check first (catches 80% of attacks instantly)
-    2. Prompt Shields API for sophisticated attacks (AI-powered)
+    2. Prompt Shields API for sophisticated attacks (AI-powered), gated by
+       the local risk score (see gated_prompt_shields)
+    
+    The tool's security profile (see security_profiles) decides which
+    layers run: bypass allows the request unscanned, regex skips layer 2.
+    
+    In speculative mode the Prompt Shields request is launched immediately
+    and the regex layer runs in a worker thread while it is in flight. A
+    regex hit cancels the pending request, so clean requests cost
+    max(regex, network) instead of regex + network.
     
     Args:
         body: Parsed JSON body of MCP request
+        gateway_cleared: Texts the gateway already cleared with Prompt
+            Shields (see prompt_shields.gateway_cleared_texts); layer 2
+            runs on the rest
+        speculative: Run both layers concurrently; defaults to the
+            PROMPT_SHIELDS_SPECULATIVE app setting
+        deadline: Request time budget for outbound calls
         
     Returns:
         DetectionResult indicating safety
     """
-    texts_to_check = extract_texts_from_mcp_request(body)
+    profile = resolve_security_profile(body)
+    if profile == SecurityProfile.BYPASS:
+        return DetectionResult(is_safe=True, category="", reason="")
+    regex_only = profile == SecurityProfile.REGEX_ONLY
     
-    # Layer 1: Fast regex check (instant, free)
-    for text in texts_to_check:
-        result = check_patterns(text)
+    if speculative is None:
+        speculative = speculative_prompt_shields_enabled()
+    
+    if speculative and not regex_only:
+        # Prompt Shields needs every text up front, so extract eagerly here
+        try:
+            texts_to_check = extract_texts_from_mcp_request(body)
+        except ExtractionLimitError as e:
+            return extraction_limit_result(e)
+        shield_texts = uncleared_texts(texts_to_check, gateway_cleared)
+        shield_task = asyncio.create_task(gated_prompt_shields(shield_texts, deadline))
+        size = sum(map(len, texts_to_check))
+        if size >= offload_threshold():
+            result = await run_scan(check_texts, texts_to_check, size=size)
+        else:
+            result = await asyncio.to_thread(check_texts, texts_to_check)
         if not result.is_safe:
+            shield_task.cancel()
             logger.info(f"Regex detected: {result.category}")
             return result
+        prompt_result = await shield_task
+    else:
+        # Layer 1: Fast regex check (instant, free), stops at the first hit
+        result, texts_to_check = await scan_mcp_request_async(body)
+        if not result.is_safe:
+            return result
+        
+        if regex_only:
+            return DetectionResult(is_safe=True, category="", reason="")
+        
+        # Layer 2: Prompt Shields for sophisticated attacks
+        prompt_result = await gated_prompt_shields(uncleared_texts(texts_to_check, gateway_cleared), deadline)
     
-    # Layer 2: Prompt Shields for sophisticated attacks
-    prompt_result = await check_with_prompt_shields(texts_to_check)
     if not prompt_result.is_safe:
         logger.info(f"Prompt Shields detected: {prompt_result.reason}")
         return prompt_result
     
     return DetectionResult(is_safe=True, category="", reason="")
+
+
+async def check_mcp_batch_async(
+    bodies: list,
+    gateway_cleared: frozenset[str] = frozenset(),
+    deadline: Deadline | None = None
+) -> BatchDetectionResult:
+    """
+    Hybrid check of a JSON-RPC batch of MCP requests.
+    
+    Elements are checked concurrently: each is first looked up in the
+    known-bad payload set, the rest are regex-checked according to their
+    security profile (bypass elements are not scanned); the batch is
+    blocked if any element is unsafe. If all elements pass, their texts are sent to Prompt Shields
+    together, so the whole batch normally costs one shared (cached, packed)
+    Prompt Shields check instead of one per element. Only when that shared
+    check detects an attack are elements re-checked individually, to report
+    which one triggered it.
+    
+    Args:
+        bodies: Parsed JSON-RPC batch (list of request objects)
+        gateway_cleared: Texts the gateway already cleared with Prompt
+            Shields (see prompt_shields.gateway_cleared_texts); layer 2
+            runs on the rest
+        deadline: Request time budget for outbound calls
+        
+    Returns:
+        BatchDetectionResult with the overall verdict and per-element results
+    """
+    safe = DetectionResult(is_safe=True, category="", reason="")
+    if not bodies:
+        # JSON-RPC 2.0: an empty batch array is an invalid request
+        return BatchDetectionResult(
+            result=DetectionResult(is_safe=False, category="invalid_request", reason="Empty JSON-RPC batch"),
+            items=[]
+        )
+    
+    async def check_element(body) -> tuple[DetectionResult, list[str], bytes | None]:
+        # Layer 1 for one element: (verdict, texts for layer 2, known-bad digest)
+        if not isinstance(body, dict):
+            return DetectionResult(
+                is_safe=False,
+                category="invalid_request",
+                reason="Batch element is not a JSON-RPC request object"
+            ), [], None
+        known, digest = await lookup_known_bad(body)
+        if known is not None:
+            return known, [], digest
+        profile = resolve_security_profile(body)
+        if profile == SecurityProfile.BYPASS:
+            return safe, [], digest
+        result, texts = await scan_mcp_request_async(body)
+        remember_blocked(digest, result)
+        # Regex-only elements are left out of the shared Prompt Shields check
+        if profile != SecurityProfile.FULL:
+            texts = []
+        return result, uncleared_texts(texts, gateway_cleared), digest
+    
+    # Layer 1: regex on every element concurrently (large elements are
+    # scanned in the process pool side by side); gather keeps element order
+    checked = await asyncio.gather(*(check_element(body) for body in bodies))
+    items = [item for item, _, _ in checked]
+    item_texts = [texts for _, texts, _ in checked]
+    digests = [digest for _, _, digest in checked]
+    
+    blocked = next((item for item in items if not item.is_safe), None)
+    if blocked is not None:
+        logger.info(f"Regex detected in batch: {blocked.category}")
+        return BatchDetectionResult(result=blocked, items=items)
+    
+    # Layer 2: one shared Prompt Shields check for the whole batch
+    all_texts = [text for texts in item_texts for text in texts]
+    shared_result = await gated_prompt_shields(all_texts, deadline)
+    if shared_result.is_safe:
+        return BatchDetectionResult(result=safe, items=items)
+    
+    logger.info(f"Prompt Shields detected in batch: {shared_result.reason}")
+    if len(bodies) == 1:
+        remember_blocked(digests[0], shared_result)
+        return BatchDetectionResult(result=shared_result, items=[shared_result])
+    
+    # Attribute the attack to individual elements (attack path only)
+    items = list(await asyncio.gather(
+        *(check_with_prompt_shields(texts, deadline) for texts in item_texts)
+    ))
+    for digest, item in zip(digests, items):
+        remember_blocked(digest, item)
+    return BatchDetectionResult(result=shared_result, items=items)
@@ -0,0 +1,171 @@
+"""
+Known-Bad Payload Set for Replayed Attacks
+
+Attack floods are dominated by replays of the same few thousand payloads.
+Every blocked request's normalized payload hash is remembered in a bounded
+LRU set, and later requests are looked up there before any detection
+layer runs, so a replay is rejected with one hash and one dict lookup.
+
+An optional Bloom filter can front the set (KNOWN_BAD_BLOOM_FILTER=true):
+it answers "definitely not seen" from a compact bit array, and only
+possible hits touch the set. Evicted keys cannot be removed from a Bloom
+filter, so it is rebuilt from the set after every max_size evictions.
+"""
+
+import hashlib
+import math
+import os
+from collections import OrderedDict
+from typing import Any
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+DEFAULT_STATS_INTERVAL = 1000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 32-byte SHA-256 digests."""
+
+    def __init__(self, capacity: int, false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        # Double hashing from two independent halves of the digest
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, digest: bytes) -> None:
+        for position in self._positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+class KnownBadPayloads:
+    """
+    Bounded LRU set of blocked payload hashes and the verdict they got.
+
+    Entries are dropped when the active rule pack version changes, since a
+    rule change can turn a previously blocked payload into an allowed one.
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_MAX_ENTRIES,
+        use_bloom_filter: bool = False,
+        stats_interval: int = DEFAULT_STATS_INTERVAL
+    ):
+        self.max_size = max_size
+        self.use_bloom_filter = use_bloom_filter
+        self.stats_interval = stats_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.version: str | None = None
+        self._last_reported = 0
+        self._evictions_since_rebuild = 0
+        self._entries: OrderedDict[bytes, Any] = OrderedDict()
+        self._bloom = BloomFilter(max_size) if use_bloom_filter else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_version(self, version: str | None) -> None:
+        if version != self.version:
+            self.version = version
+            self._entries.clear()
+            if self._bloom is not None:
+                self._bloom = BloomFilter(self.max_size)
+
+    def get(self, digest: bytes, version: str | None = None) -> Any | None:
+        """Return the remembered verdict for a payload hash, or None."""
+        self._check_version(version)
+        if self._bloom is not None and digest not in self._bloom:
+            self.misses += 1
+            return None
+        verdict = self._entries.get(digest)
+        if verdict is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return verdict
+
+    def add(self, digest: bytes, verdict: Any, version: str | None = None) -> None:
+        """Remember a blocked payload, evicting the least recently seen one if full."""
+        if self.max_size <= 0:
+            return
+        self._check_version(version)
+        self._entries[digest] = verdict
+        self._entries.move_to_end(digest)
+        if self._bloom is not None:
+            self._bloom.add(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            self._evictions_since_rebuild += 1
+        if self._bloom is not None and self._evictions_since_rebuild >= self.max_size:
+            self._rebuild_bloom()
+
+    def _rebuild_bloom(self) -> None:
+        self._bloom = BloomFilter(self.max_size)
+        for digest in self._entries:
+            self._bloom.add(digest)
+        self._evictions_since_rebuild = 0
+
+    def should_report(self) -> bool:
+        """True every stats_interval lookups, for periodic stats logging."""
+        lookups = self.hits + self.misses
+        if self.stats_interval <= 0 or lookups - self._last_reported < self.stats_interval:
+            return False
+        self._last_reported = lookups
+        return True
+
+    def stats(self) -> dict[str, int | float]:
+        """Return hit/miss counters for telemetry."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def payload_digest(canonical_payload: str) -> bytes:
+    """SHA-256 digest of a canonical payload string."""
+    return hashlib.sha256(canonical_payload.encode("utf-8", "surrogatepass")).digest()
+
+
+_known_bad: KnownBadPayloads | None = None
+
+
+def get_known_bad_payloads() -> KnownBadPayloads | None:
+    """
+    Get the process-wide known-bad payload set.
+
+    Configured from KNOWN_BAD_MAX_ENTRIES, KNOWN_BAD_BLOOM_FILTER and
+    KNOWN_BAD_STATS_INTERVAL on first use.
+
+    Returns:
+        KnownBadPayloads or None if disabled (size 0)
+    """
+    global _known_bad
+
+    if _known_bad is None:
+        max_size = int(os.environ.get("KNOWN_BAD_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        if max_size <= 0:
+            return None
+        _known_bad = KnownBadPayloads(
+            max_size=max_size,
+            use_bloom_filter=os.environ.get("KNOWN_BAD_BLOOM_FILTER", "false").lower() == "true",
+            stats_interval=int(os.environ.get("KNOWN_BAD_STATS_INTERVAL", DEFAULT_STATS_INTERVAL))
+        )
+    return _known_bad
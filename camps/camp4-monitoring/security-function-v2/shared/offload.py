@@ -0,0 +1,103 @@
+"""
+Process-Pool Offload for CPU-Heavy Scanning
+
+Regex and entropy scanning hold the GIL, so scanning a multi-MB tool
+response inline stalls every other request served by the same worker.
+Payloads at or above OFFLOAD_THRESHOLD_BYTES are scanned in a warm pool of
+worker processes instead; smaller ones stay inline, where the pickling
+round trip would cost more than the scan.
+
+Configuration (app settings):
+- OFFLOAD_THRESHOLD_BYTES: minimum payload size to offload (default 256 KB)
+- OFFLOAD_MAX_WORKERS: pool size (default: CPU count; 0 disables offload)
+
+Workers are started with "spawn" rather than fork, because the Functions
+host process runs gRPC threads that must not be copied into children.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OFFLOAD_THRESHOLD_BYTES = 256 * 1024
+
+
+def _warm_worker() -> None:
+    """Import the scanners and compile the rule pack once per worker."""
+    from .rule_packs import get_active_rule_pack
+    get_active_rule_pack()
+
+
+def _ping() -> None:
+    """No-op task used to start every worker ahead of the first large body."""
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def offload_threshold() -> int:
+    """Payload size (bytes or characters) at which scanning is offloaded."""
+    return int(os.environ.get("OFFLOAD_THRESHOLD_BYTES", DEFAULT_OFFLOAD_THRESHOLD_BYTES))
+
+
+def get_process_pool() -> ProcessPoolExecutor | None:
+    """
+    Get the process-wide scanning pool, starting its workers on first use.
+
+    Returns:
+        ProcessPoolExecutor, or None when offload is disabled
+    """
+    global _pool
+
+    if _pool is None:
+        max_workers = int(os.environ.get("OFFLOAD_MAX_WORKERS", os.cpu_count() or 1))
+        if max_workers <= 0:
+            return None
+        _pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker
+        )
+        for _ in range(max_workers):
+            _pool.submit(_ping)
+    return _pool
+
+
+def shutdown_process_pool() -> None:
+    """Stop the pool's workers (a new pool is created on next use)."""
+    global _pool
+
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_scan(func: Callable[..., Any], *args, size: int) -> Any:
+    """
+    Run a CPU-bound scan inline or in the process pool, depending on size.
+
+    Args:
+        func: Module-level (picklable) scanning function
+        *args: Picklable arguments for func
+        size: Payload size used against OFFLOAD_THRESHOLD_BYTES
+
+    Returns:
+        Whatever func returns
+    """
+    pool = get_process_pool() if size >= offload_threshold() else None
+    if pool is None:
+        return func(*args)
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A crashed worker poisons the pool; replace it and scan inline
+        logger.warning("Scanning process pool broke, restarting it")
+        shutdown_process_pool()
+        return func(*args)
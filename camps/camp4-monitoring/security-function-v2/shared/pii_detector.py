@@ -3,17 +3,63 @@ PII Detection Module using Azure AI Language
 
 Wraps Azure AI Language's PII detection service to identify and redact
 personally identifiable information from MCP responses.
+
+The TextAnalyticsClient and its credential are process-wide: the client's
+pipeline keeps its connection pool and the credential policy caches the
+access token, so repeated sanitize calls skip the token fetch and TLS
+handshake. An authentication failure drops both so the next call starts
+from a fresh credential.
+
+detect_and_redact_pii_async is the same pipeline on the aio client, for
+async handlers: chunk batches are sent concurrently, bounded by a
+process-wide semaphore (PII_MAX_CONCURRENT_REQUESTS) shared by every
+in-flight sanitize request, and the worker thread is never blocked on
+the network.
+
+detect_and_redact_json_pii_async submits only the string leaves of JSON
+bodies (PII_JSON_MODE), cutting billed characters on structured tool
+responses.
 """
 
+import asyncio
+import atexit
+import bisect
+import json
 import os
 import logging
+import re
+import threading
 from typing import NamedTuple
 
 from azure.ai.textanalytics import TextAnalyticsClient
+from azure.ai.textanalytics.aio import TextAnalyticsClient as AsyncTextAnalyticsClient
+from azure.core.exceptions import ClientAuthenticationError, HttpResponseError
 from azure.identity import DefaultAzureCredential, ManagedIdentityCredential
+from azure.identity.aio import (
+    DefaultAzureCredential as AsyncDefaultAzureCredential,
+    ManagedIdentityCredential as AsyncManagedIdentityCredential,
+)
+
+from .redaction import RedactionBuilder
+from .resilience import Deadline, get_circuit_breaker
 
 logger = logging.getLogger(__name__)
 
+# Service limits for synchronous PII recognition
+MAX_DOCUMENT_CHARS = 5120
+DEFAULT_BATCH_DOCUMENTS = 5
+
+# Chunks end and start between tokens: after whitespace or a JSON delimiter
+CHUNK_BOUNDARY_CHARS = frozenset(' \t\r\n,:{}[]"')
+# How far back from the document limit to look for a boundary
+CHUNK_BOUNDARY_SEARCH_CHARS = 256
+# Neighboring chunks share up to this much text, enough to hold an email,
+# phone number or street address cut by the previous chunk
+CHUNK_OVERLAP_CHARS = 128
+
+# Language requests in flight at once across all async sanitize requests
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+
 
 class PIIResult(NamedTuple):
     """Result of PII detection and redaction."""
@@ -22,34 +68,318 @@ class PIIResult(NamedTuple):
     error: str | None
 
 
+_client: TextAnalyticsClient | None = None
+_credential: ManagedIdentityCredential | DefaultAzureCredential | None = None
+_client_endpoint: str | None = None
+# PII detection runs on worker threads; only one of them may build the client
+_client_lock = threading.Lock()
+
+
+def _create_credential() -> ManagedIdentityCredential | DefaultAzureCredential:
+    # Use managed identity in Azure, DefaultAzureCredential for local dev
+    client_id = os.environ.get("AZURE_CLIENT_ID")
+    if client_id:
+        return ManagedIdentityCredential(client_id=client_id)
+    return DefaultAzureCredential()
+
+
 def get_client() -> TextAnalyticsClient | None:
     """
-    Get Azure AI Language client with managed identity authentication.
+    Get the process-wide Azure AI Language client, creating it on first use.
+    
+    The client is rebuilt if AI_SERVICES_ENDPOINT changes.
     
     Returns:
         TextAnalyticsClient or None if configuration is missing
     """
+    global _client, _credential, _client_endpoint
+    
     endpoint = os.environ.get("AI_SERVICES_ENDPOINT")
     if not endpoint:
         logger.warning("AI_SERVICES_ENDPOINT not configured")
         return None
     
-    # Use managed identity in Azure, DefaultAzureCredential for local dev
+    client = _client
+    if client is not None and _client_endpoint == endpoint:
+        return client
+    
+    with _client_lock:
+        if _client is None or _client_endpoint != endpoint:
+            _close_client()
+            _credential = _create_credential()
+            _client = TextAnalyticsClient(endpoint=endpoint, credential=_credential)
+            _client_endpoint = endpoint
+        return _client
+
+
+def _close_client() -> None:
+    global _client, _credential, _client_endpoint
+    
+    for resource in (_client, _credential):
+        if resource is not None:
+            try:
+                resource.close()
+            except Exception as e:
+                logger.debug(f"Error closing Language client: {e}")
+    _client = None
+    _credential = None
+    _client_endpoint = None
+
+
+@atexit.register
+def reset_client() -> None:
+    """Close the process-wide client and credential; the next call creates new ones."""
+    with _client_lock:
+        _close_client()
+
+
+def is_auth_failure(error: Exception) -> bool:
+    """True if a Language call failed because the credential or its token was rejected."""
+    if isinstance(error, ClientAuthenticationError):
+        return True
+    return isinstance(error, HttpResponseError) and error.status_code in (401, 403)
+
+
+class _AsyncLanguageClient(NamedTuple):
+    """aio client, its credential and the semaphore bounding its requests."""
+    client: AsyncTextAnalyticsClient
+    credential: AsyncManagedIdentityCredential | AsyncDefaultAzureCredential
+    semaphore: asyncio.Semaphore
+    endpoint: str
+    loop: asyncio.AbstractEventLoop
+
+
+_async_client: _AsyncLanguageClient | None = None
+
+
+def _create_async_credential() -> AsyncManagedIdentityCredential | AsyncDefaultAzureCredential:
     client_id = os.environ.get("AZURE_CLIENT_ID")
     if client_id:
-        credential = ManagedIdentityCredential(client_id=client_id)
-    else:
-        credential = DefaultAzureCredential()
+        return AsyncManagedIdentityCredential(client_id=client_id)
+    return AsyncDefaultAzureCredential()
+
+
+def get_async_client() -> _AsyncLanguageClient | None:
+    """
+    Get the process-wide aio Language client for the running event loop.
+    
+    The client's session is bound to the loop it was created on, so it is
+    recreated if called from a different loop or if AI_SERVICES_ENDPOINT
+    changes.
+    
+    Returns:
+        _AsyncLanguageClient or None if configuration is missing
+    """
+    global _async_client
+    
+    endpoint = os.environ.get("AI_SERVICES_ENDPOINT")
+    if not endpoint:
+        logger.warning("AI_SERVICES_ENDPOINT not configured")
+        return None
+    
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.loop is not loop or _async_client.endpoint != endpoint:
+        credential = _create_async_credential()
+        max_concurrent = int(os.environ.get("PII_MAX_CONCURRENT_REQUESTS", DEFAULT_MAX_CONCURRENT_REQUESTS))
+        _async_client = _AsyncLanguageClient(
+            client=AsyncTextAnalyticsClient(endpoint=endpoint, credential=credential),
+            credential=credential,
+            semaphore=asyncio.Semaphore(max(1, max_concurrent)),
+            endpoint=endpoint,
+            loop=loop
+        )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """Close the process-wide aio client and credential, if created on this loop."""
+    global _async_client
+    
+    language, _async_client = _async_client, None
+    if language is None or language.loop is not asyncio.get_running_loop():
+        return
+    for resource in (language.client, language.credential):
+        try:
+            await resource.close()
+        except Exception as e:
+            logger.debug(f"Error closing async Language client: {e}")
+
+
+def call_options(deadline: Deadline) -> dict[str, float]:
+    """
+    Per-call azure-core options that keep a Language call within the deadline.
+    
+    "timeout" bounds the whole call including retries; the transport
+    timeouts bound a single connection attempt and read.
+    """
+    remaining = deadline.remaining()
+    return {
+        "timeout": remaining,
+        "connection_timeout": remaining,
+        "read_timeout": remaining,
+    }
+
+
+def batch_documents() -> int:
+    """Chunks sent per recognize_pii_entities request (PII_BATCH_DOCUMENTS)."""
+    return max(1, int(os.environ.get("PII_BATCH_DOCUMENTS", DEFAULT_BATCH_DOCUMENTS)))
+
+
+class TextChunk(NamedTuple):
+    """A slice of the text sent as one Language document."""
+    offset: int
+    text: str
+
+
+class PIIEntity(NamedTuple):
+    """A recognized entity with its offset into the full text."""
+    offset: int
+    length: int
+    category: str
+    subcategory: str | None
+    confidence_score: float
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    # A cut at index falls between tokens if the character before it ends one
+    return text[index - 1] in CHUNK_BOUNDARY_CHARS
+
+
+def split_into_chunks(
+    text: str,
+    max_chars: int = MAX_DOCUMENT_CHARS,
+    overlap: int = CHUNK_OVERLAP_CHARS
+) -> list[TextChunk]:
+    """
+    Split text into document-sized chunks at whitespace/JSON token boundaries.
+    
+    Each chunk ends at the last boundary within CHUNK_BOUNDARY_SEARCH_CHARS
+    of max_chars, and the next one starts at the first boundary within
+    `overlap` characters before that, so an entity cut by one chunk is seen
+    whole by its neighbor. Text without a nearby boundary is cut hard.
+    
+    Args:
+        text: The text to scan for PII
+        max_chars: Maximum characters per chunk
+        overlap: Maximum characters shared by neighboring chunks
+        
+    Returns:
+        Chunks with their offsets into text, in order
+    """
+    chunks = []
+    start = 0
+    while True:
+        end = start + max_chars
+        if end >= len(text):
+            chunks.append(TextChunk(start, text[start:]))
+            return chunks
+        
+        floor = max(start + 1, end - CHUNK_BOUNDARY_SEARCH_CHARS)
+        cut = next((i for i in range(end, floor - 1, -1) if _is_boundary(text, i)), end)
+        chunks.append(TextChunk(start, text[start:cut]))
+        
+        floor = max(start + 1, cut - overlap)
+        start = next((i for i in range(floor, cut) if _is_boundary(text, i)), floor)
+
+
+def split_into_batches(text: str) -> list[list[TextChunk]]:
+    """
+    Split text into chunks grouped into request batches.
+    
+    Args:
+        text: The text to scan for PII
+        
+    Returns:
+        Batches of at most PII_BATCH_DOCUMENTS chunks, in text order
+    """
+    chunks = split_into_chunks(text)
+    batch_size = batch_documents()
+    return [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+
+
+def collect_entities(batch: list[TextChunk], results) -> tuple[list[PIIEntity], str | None]:
+    """
+    Map one request's document results back to offsets in the full text.
+    
+    Args:
+        batch: Chunks sent as documents, in order
+        results: recognize_pii_entities results, one per document in order
+        
+    Returns:
+        Tuple of (entities found, last document error)
+    """
+    entities = []
+    error = None
+    for chunk, result in zip(batch, results):
+        if result.is_error:
+            logger.error(f"PII detection error: {result.error}")
+            error = str(result.error)
+            continue
+        entities.extend(
+            PIIEntity(
+                offset=chunk.offset + entity.offset,
+                length=entity.length,
+                category=entity.category,
+                subcategory=entity.subcategory,
+                confidence_score=entity.confidence_score
+            )
+            for entity in result.entities
+        )
+    return entities, error
+
+
+def redact_entities(text: str, entities) -> tuple[str, list[dict]]:
+    """
+    Replace recognized entities with [REDACTED-<category>].
+    
+    Duplicate entities from overlapping chunks collapse to one, and an
+    entity cut at one chunk's edge merges with the whole one seen by the
+    next (see redaction for the precedence rule).
+    
+    Args:
+        text: The text the entities were recognized in
+        entities: Entities with offsets into text
+        
+    Returns:
+        Tuple of (redacted text, entity summaries without the matched text)
+    """
+    builder = RedactionBuilder(text)
+    for entity in entities:
+        builder.add(entity.offset, entity.offset + entity.length, f"[REDACTED-{entity.category}]", finding=entity)
+    redacted, spans = builder.build()
     
-    return TextAnalyticsClient(endpoint=endpoint, credential=credential)
+    entities_found = [
+        {
+            "category": span.finding.category,
+            "subcategory": span.finding.subcategory,
+            "confidence": span.finding.confidence_score,
+            "text_length": span.end - span.start
+        }
+        for span in spans
+    ]
+    return redacted, entities_found
 
 
-def detect_and_redact_pii(text: str) -> PIIResult:
+def detect_and_redact_pii(text: str, deadline: Deadline | None = None) -> PIIResult:
     """
     Detect and redact PII from text using Azure AI Language.
     
+    Text longer than MAX_DOCUMENT_CHARS is split into overlapping chunks
+    at token boundaries (see split_into_chunks) that are sent
+    PII_BATCH_DOCUMENTS documents per request, so a 50 KB response costs
+    two round trips rather than ten. Entities are mapped back to offsets
+    in the full text and redacted in one pass. A document-level
+    error leaves that chunk unredacted (except where a neighbor overlaps
+    it) and is reported in the result's error.
+    
+    Language calls are bounded by the request deadline and guarded by a
+    circuit breaker. While the circuit is open, or once the deadline is
+    used up, the text is returned unredacted with an error, the same as
+    any other PII service failure (credential scanning still runs).
+    
     Args:
         text: The text to scan for PII
+        deadline: Request time budget; defaults to a fresh budget
         
     Returns:
         PIIResult with redacted text and list of entities found
@@ -65,77 +395,338 @@ def detect_and_redact_pii(text: str) -> PIIResult:
             error="PII detection service not configured"
         )
     
+    if deadline is None:
+        deadline = Deadline.for_request()
+    breaker = get_circuit_breaker("pii_detection")
+    
+    if deadline.expired:
+        return PIIResult(redacted_text=text, entities_found=[], error="Request deadline exceeded")
+    if not breaker.allow_request(deadline.correlation_id):
+        return PIIResult(redacted_text=text, entities_found=[], error="PII detection circuit open")
+    
     try:
-        # Azure AI Language has a character limit per document
-        # Split large texts if needed
-        max_chars = 5000
-        if len(text) > max_chars:
-            # Process in chunks, preserving structure
-            chunks = [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
-            all_entities = []
-            redacted_chunks = []
-            
-            for chunk in chunks:
-                result = client.recognize_pii_entities([chunk])[0]
-                if result.is_error:
-                    logger.error(f"PII detection error: {result.error}")
-                    redacted_chunks.append(chunk)
-                    continue
-                
-                # Redact entities in reverse order to preserve positions
-                redacted = chunk
-                for entity in sorted(result.entities, key=lambda e: e.offset, reverse=True):
-                    redaction = f"[REDACTED-{entity.category}]"
-                    redacted = redacted[:entity.offset] + redaction + redacted[entity.offset + entity.length:]
-                    all_entities.append({
-                        "category": entity.category,
-                        "subcategory": entity.subcategory,
-                        "confidence": entity.confidence_score,
-                        "text_length": entity.length
-                    })
-                redacted_chunks.append(redacted)
-            
-            return PIIResult(
-                redacted_text="".join(redacted_chunks),
-                entities_found=all_entities,
-                error=None
-            )
-        
-        # Process single document
-        result = client.recognize_pii_entities([text])[0]
-        
-        if result.is_error:
-            logger.error(f"PII detection error: {result.error}")
-            return PIIResult(
-                redacted_text=text,
-                entities_found=[],
-                error=str(result.error)
-            )
-        
-        # Redact entities in reverse order to preserve positions
-        redacted = text
-        entities_found = []
+        # Azure AI Language has a character limit per document, so large
+        # texts are split and the chunks sent several documents per request
+        batches = split_into_batches(text)
+        all_entities = []
+        error = None
         
-        for entity in sorted(result.entities, key=lambda e: e.offset, reverse=True):
-            redaction = f"[REDACTED-{entity.category}]"
-            redacted = redacted[:entity.offset] + redaction + redacted[entity.offset + entity.length:]
-            entities_found.append({
-                "category": entity.category,
-                "subcategory": entity.subcategory,
-                "confidence": entity.confidence_score,
-                "text_length": entity.length
-            })
+        for batch in batches:
+            if deadline.expired:
+                error = "Request deadline exceeded"
+                break
+            
+            results = client.recognize_pii_entities([chunk.text for chunk in batch], **call_options(deadline))
+            entities, batch_error = collect_entities(batch, results)
+            all_entities.extend(entities)
+            error = batch_error or error
         
+        breaker.record_success(deadline.correlation_id)
+        redacted, entities_found = redact_entities(text, all_entities)
         return PIIResult(
             redacted_text=redacted,
             entities_found=entities_found,
-            error=None
+            error=error
         )
         
     except Exception as e:
         logger.exception("PII detection failed")
+        breaker.record_failure(deadline.correlation_id)
+        if is_auth_failure(e):
+            # Don't keep retrying with a credential the service rejects
+            reset_client()
         return PIIResult(
             redacted_text=text,
             entities_found=[],
             error=str(e)
         )
+
+
+async def _recognize_batch(
+    language: _AsyncLanguageClient,
+    batch: list[TextChunk],
+    deadline: Deadline
+) -> tuple[list[PIIEntity], str | None]:
+    async with language.semaphore:
+        # The deadline may have passed while queued behind other requests
+        if deadline.expired:
+            return [], "Request deadline exceeded"
+        results = await language.client.recognize_pii_entities(
+            [chunk.text for chunk in batch], **call_options(deadline)
+        )
+    return collect_entities(batch, results)
+
+
+async def recognize_pii_async(text: str, deadline: Deadline | None = None) -> tuple[list[PIIEntity], str | None]:
+    """
+    Recognize PII entities in text using the aio Azure AI Language client.
+    
+    All chunk batches are sent concurrently (bounded by
+    PII_MAX_CONCURRENT_REQUESTS across the process) without blocking the
+    calling thread. Any failure yields no entities and an error, so the
+    caller leaves the text unredacted.
+    
+    Args:
+        text: The text to scan for PII
+        deadline: Request time budget; defaults to a fresh budget
+        
+    Returns:
+        Tuple of (entities with offsets into text, error or None)
+    """
+    if not text or not text.strip():
+        return [], None
+    
+    language = get_async_client()
+    if not language:
+        return [], "PII detection service not configured"
+    
+    if deadline is None:
+        deadline = Deadline.for_request()
+    breaker = get_circuit_breaker("pii_detection")
+    
+    if deadline.expired:
+        return [], "Request deadline exceeded"
+    if not breaker.allow_request(deadline.correlation_id):
+        return [], "PII detection circuit open"
+    
+    try:
+        outcomes = await asyncio.gather(
+            *(_recognize_batch(language, batch, deadline) for batch in split_into_batches(text)),
+            return_exceptions=True
+        )
+    except asyncio.CancelledError:
+        # Free a half-open trial held by a call that will never report back
+        breaker.release_trial()
+        raise
+    
+    failure = next((o for o in outcomes if isinstance(o, BaseException)), None)
+    if failure is not None:
+        logger.error(f"PII detection failed: {failure!r}")
+        breaker.record_failure(deadline.correlation_id)
+        if is_auth_failure(failure):
+            # Don't keep retrying with a credential the service rejects
+            await close_async_client()
+        return [], str(failure)
+    
+    all_entities = []
+    error = None
+    for entities, batch_error in outcomes:
+        all_entities.extend(entities)
+        error = batch_error or error
+    
+    breaker.record_success(deadline.correlation_id)
+    return all_entities, error
+
+
+async def detect_and_redact_pii_async(text: str, deadline: Deadline | None = None) -> PIIResult:
+    """
+    Detect and redact PII from text using the aio Azure AI Language client.
+    
+    Same behavior as detect_and_redact_pii, with the Language calls made
+    by recognize_pii_async.
+    
+    Args:
+        text: The text to scan for PII
+        deadline: Request time budget; defaults to a fresh budget
+        
+    Returns:
+        PIIResult with redacted text and list of entities found
+    """
+    entities, error = await recognize_pii_async(text, deadline)
+    redacted, entities_found = redact_entities(text, entities)
+    return PIIResult(
+        redacted_text=redacted,
+        entities_found=entities_found,
+        error=error
+    )
+
+
+def pii_json_mode_enabled() -> bool:
+    """Whether JSON bodies are submitted leaf by leaf (PII_JSON_MODE, default on)."""
+    return os.environ.get("PII_JSON_MODE", "true").lower() == "true"
+
+
+def _parse_embedded_json(value: str) -> dict | list | None:
+    # MCP tool results carry their JSON output as a string inside the
+    # JSON-RPC body; treat those strings as documents of their own
+    stripped = value.lstrip()
+    if not stripped.startswith(("{", "[")):
+        return None
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, (dict, list)) else None
+
+
+def _dump_like(data, original: str) -> str:
+    # Keep pretty-printed documents pretty-printed
+    return json.dumps(data, ensure_ascii=False, indent=2 if "\n" in original.strip() else None)
+
+
+# Object keys that look like field names ("email", "address2") are not
+# submitted; anything else (an email, a name with a space, a phone or ID
+# number) may be PII used as a key and is packed like a value
+FIELD_NAME_PATTERN = re.compile(r"[A-Za-z_]+[0-9]{0,2}")
+
+
+def _map_key(rebuilt: dict, new_key: str) -> str:
+    # Two keys redacted to the same text must not overwrite each other
+    candidate, n = new_key, 1
+    while candidate in rebuilt:
+        n += 1
+        candidate = f"{new_key} #{n}"
+    return candidate
+
+
+def _map_string_leaves(node, visit, key: str = ""):
+    """
+    Rebuild a JSON value with every string leaf replaced by visit(value, key).
+    
+    Object keys other than plain field names are leaves too (PII is often
+    used as a key, e.g. contacts keyed by email); they are visited with the
+    enclosing object's key.
+    """
+    if isinstance(node, dict):
+        rebuilt = {}
+        for k, v in node.items():
+            new_key = k if FIELD_NAME_PATTERN.fullmatch(k) else visit(k, key)
+            rebuilt[_map_key(rebuilt, new_key) if new_key != k else k] = _map_string_leaves(v, visit, k)
+        return rebuilt
+    if isinstance(node, list):
+        return [_map_string_leaves(v, visit, key) for v in node]
+    if isinstance(node, str):
+        embedded = _parse_embedded_json(node)
+        if embedded is None:
+            return visit(node, key)
+        rebuilt = _map_string_leaves(embedded, visit, key)
+        return node if rebuilt == embedded else _dump_like(rebuilt, node)
+    return node
+
+
+class LeafSubmission(NamedTuple):
+    """String leaves packed into one text for recognition."""
+    text: str
+    # Offset of each unique leaf value within text, sorted by offset
+    offsets: list[int]
+    values: list[str]
+
+
+def pack_string_leaves(data) -> LeafSubmission:
+    """
+    Pack the unique, non-blank string leaves of a JSON value for recognition.
+    
+    Each leaf is sent as "<key>: <value>" on its own line, so the service
+    still sees the field name (an SSN or phone number is often only
+    recognizable by its key) without the braces, quotes, indentation,
+    numbers and repeated values of the raw JSON. Object keys that are not
+    plain field names are packed as leaves of their own, prefixed with the
+    enclosing object's key.
+    
+    Args:
+        data: Parsed JSON value
+        
+    Returns:
+        LeafSubmission mapping offsets in the packed text to leaf values
+    """
+    keys: dict[str, str] = {}
+    
+    def collect(value: str, key: str) -> str:
+        if value.strip() and value not in keys:
+            keys[value] = key
+        return value
+    
+    _map_string_leaves(data, collect)
+    
+    parts = []
+    offsets = []
+    position = 0
+    for value, key in keys.items():
+        prefix = f"{key}: " if key else ""
+        offsets.append(position + len(prefix))
+        line = f"{prefix}{value}\n"
+        parts.append(line)
+        position += len(line)
+    return LeafSubmission("".join(parts), offsets, list(keys))
+
+
+def redact_leaves(submission: LeafSubmission, entities: list[PIIEntity]) -> tuple[dict[str, str], list[dict]]:
+    """
+    Apply entities found in a packed submission to the leaf values.
+    
+    Entities are clipped to the value they fall in; parts covering a key
+    prefix or line break are dropped.
+    
+    Args:
+        submission: Output of pack_string_leaves
+        entities: Entities with offsets into submission.text
+        
+    Returns:
+        Tuple of (original value -> redacted value for changed leaves,
+        entity summaries)
+    """
+    per_leaf: dict[int, list[PIIEntity]] = {}
+    for entity in entities:
+        start, end = entity.offset, entity.offset + entity.length
+        index = bisect.bisect_right(submission.offsets, start) - 1
+        # An entity starting in a key prefix may still reach into the value
+        if index < 0 or start >= submission.offsets[index] + len(submission.values[index]):
+            index += 1
+        while index < len(submission.values) and submission.offsets[index] < end:
+            leaf_start = submission.offsets[index]
+            leaf_end = leaf_start + len(submission.values[index])
+            clipped_start, clipped_end = max(start, leaf_start), min(end, leaf_end)
+            if clipped_end > clipped_start:
+                per_leaf.setdefault(index, []).append(entity._replace(
+                    offset=clipped_start - leaf_start, length=clipped_end - clipped_start
+                ))
+            index += 1
+    
+    redacted_values = {}
+    entities_found = []
+    for index, leaf_entities in per_leaf.items():
+        value = submission.values[index]
+        redacted_values[value], found = redact_entities(value, leaf_entities)
+        entities_found.extend(found)
+    return redacted_values, entities_found
+
+
+async def detect_and_redact_json_pii_async(body_text: str, deadline: Deadline | None = None) -> PIIResult:
+    """
+    Detect and redact PII in a JSON body by submitting only its string leaves.
+    
+    The body is parsed once, its unique string leaves and non-field-name
+    object keys (including those of JSON documents embedded in strings, as in MCP tool
+    results) are packed by pack_string_leaves and recognized, and the
+    redacted values are written back in place. The body is re-serialized only if something was
+    redacted; otherwise it is returned unchanged. Bodies that are not a
+    JSON object or array fall back to detect_and_redact_pii_async.
+    
+    Args:
+        body_text: Raw response body
+        deadline: Request time budget; defaults to a fresh budget
+        
+    Returns:
+        PIIResult with redacted body and list of entities found
+    """
+    try:
+        data = json.loads(body_text)
+    except ValueError:
+        data = None
+    if not isinstance(data, (dict, list)):
+        return await detect_and_redact_pii_async(body_text, deadline)
+    
+    submission = pack_string_leaves(data)
+    logger.debug(f"PII JSON mode: submitting {len(submission.text)} of {len(body_text)} characters")
+    
+    entities, error = await recognize_pii_async(submission.text, deadline)
+    redacted_values, entities_found = redact_leaves(submission, entities)
+    if not redacted_values:
+        return PIIResult(redacted_text=body_text, entities_found=[], error=error)
+    
+    rebuilt = _map_string_leaves(data, lambda value, key: redacted_values.get(value, value))
+    return PIIResult(
+        redacted_text=_dump_like(rebuilt, body_text),
+        entities_found=entities_found,
+        error=error
+    )
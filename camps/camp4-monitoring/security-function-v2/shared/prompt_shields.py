@@ -0,0 +1,574 @@
+"""
+Prompt Shields Client Module
+
+Long-lived client for the Azure AI Content Safety Prompt Shields REST API.
+
+Creating a credential, fetching a token and opening a new HTTP session for
+every input check means a token request plus a fresh TCP+TLS handshake per
+call. This module keeps one client per worker process with:
+- A pooled aiohttp session reused across requests
+- A cached access token refreshed proactively before it expires
+- A shutdown hook to close the session and credential cleanly
+- A bounded LRU+TTL cache of verdicts so repeated prompts skip the API
+- Verification of the APIM gateway's "already cleared" verdict header
+"""
+
+import asyncio
+import atexit
+import hashlib
+import hmac
+import os
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+import aiohttp
+from azure.identity.aio import DefaultAzureCredential
+
+logger = logging.getLogger(__name__)
+
+PROMPT_SHIELDS_API_VERSION = "2024-09-01"
+TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+# Refresh the cached token this many seconds before it expires
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+# Connection pool size for the shared session
+DEFAULT_MAX_CONNECTIONS = 100
+
+# Prompt Shields input limits per request: the user prompt and the combined
+# documents are each capped at 10K characters, with at most 5 documents
+MAX_USER_PROMPT_CHARS = 10000
+MAX_DOCUMENTS = 5
+MAX_DOCUMENTS_TOTAL_CHARS = 10000
+
+# Verdict cache defaults (overridable via app settings)
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL_SECONDS = 300
+DEFAULT_CACHE_STATS_INTERVAL = 100
+
+# Header set by the mcp-content-safety policy fragment when Prompt Shields
+# returned a clean verdict for the tool arguments it analyzed:
+# "hmac-sha256:<hex digest>" keyed with GATEWAY_VERDICT_KEY
+GATEWAY_VERDICT_HEADER = "x-prompt-shields-cleared"
+GATEWAY_VERDICT_PREFIX = "hmac-sha256:"
+
+
+class ShieldPromptRequest(NamedTuple):
+    """One text:shieldPrompt call: a user prompt plus document slots."""
+    user_prompt: str
+    documents: list[str]
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    """
+    Split text into pieces of at most max_chars, preferring whitespace breaks.
+
+    Args:
+        text: The text to split
+        max_chars: Maximum length of each piece
+
+    Returns:
+        List of pieces that concatenate back to the original text
+    """
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", max_chars // 2, max_chars)
+        cut = cut + 1 if cut != -1 else max_chars
+        pieces.append(text[:cut])
+        text = text[cut:]
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def plan_shield_prompt_requests(
+    texts: list[str],
+    max_prompt_chars: int = MAX_USER_PROMPT_CHARS,
+    max_documents: int = MAX_DOCUMENTS,
+    max_documents_chars: int = MAX_DOCUMENTS_TOTAL_CHARS
+) -> list[ShieldPromptRequest]:
+    """
+    Pack texts into the minimum number of Prompt Shields requests.
+
+    Texts are joined into the user prompt while it fits (so small bodies
+    produce exactly the same single request as before). Overflow is split
+    into pieces that fit the service limits and placed into document slots,
+    then into additional requests as needed.
+
+    Args:
+        texts: Extracted texts to analyze
+        max_prompt_chars: User prompt character limit
+        max_documents: Maximum documents per request
+        max_documents_chars: Combined document character limit per request
+
+    Returns:
+        List of requests covering every text
+    """
+    pieces: list[str] = []
+    for text in texts:
+        if text and text.strip():
+            pieces.extend(split_text(text, min(max_prompt_chars, max_documents_chars)))
+
+    requests: list[ShieldPromptRequest] = []
+    i = 0
+    while i < len(pieces):
+        # Fill the user prompt first, joining pieces with a space as before
+        user_prompt = pieces[i]
+        i += 1
+        while i < len(pieces) and len(user_prompt) + 1 + len(pieces[i]) <= max_prompt_chars:
+            user_prompt += " " + pieces[i]
+            i += 1
+
+        # Then fill the document slots within the combined document budget
+        documents: list[str] = []
+        documents_chars = 0
+        while (
+            i < len(pieces)
+            and len(documents) < max_documents
+            and documents_chars + len(pieces[i]) <= max_documents_chars
+        ):
+            documents.append(pieces[i])
+            documents_chars += len(pieces[i])
+            i += 1
+
+        requests.append(ShieldPromptRequest(user_prompt, documents))
+    return requests
+
+
+class PromptShieldsError(Exception):
+    """Raised when the Prompt Shields API returns a non-200 response."""
+
+    def __init__(self, status: int, text: str):
+        super().__init__(f"Prompt Shields API returned {status}: {text}")
+        self.status = status
+        self.text = text
+
+
+async def _close_resources(
+    session: aiohttp.ClientSession | None,
+    credential: DefaultAzureCredential | None
+) -> None:
+    """Close a session and credential, logging rather than raising failures."""
+    try:
+        if session is not None and not session.closed:
+            await session.close()
+        if credential is not None:
+            await credential.close()
+    except Exception as e:
+        logger.warning(f"Failed to close Prompt Shields resources: {e}")
+
+
+class PromptShieldsClient:
+    """
+    Reusable Prompt Shields client with a pooled session and token cache.
+
+    The session is bound to the event loop it was created on; if the client
+    is used from a different loop (e.g. across test runs), the session is
+    recreated transparently. Loop-bound resources are closed when their
+    loop shuts down (asyncio.run cancels the client's shutdown guard task)
+    or, failing that, when the client moves to another loop.
+    """
+
+    def __init__(self, endpoint: str, max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        self.endpoint = endpoint.rstrip('/')
+        self.api_url = (
+            f"{self.endpoint}/contentsafety/text:shieldPrompt"
+            f"?api-version={PROMPT_SHIELDS_API_VERSION}"
+        )
+        self.max_connections = max_connections
+        self._credential: DefaultAzureCredential | None = None
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._token: str | None = None
+        self._token_expires_on = 0.0
+        self._token_lock: asyncio.Lock | None = None
+        self._shutdown_guard: asyncio.Task | None = None
+        # Closes scheduled for resources of a previous loop (keeps the tasks alive)
+        self._pending_closes: set[asyncio.Task] = set()
+
+    def _bind_to_running_loop(self) -> None:
+        """(Re)create loop-bound resources if the running loop changed."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._session is not None and not self._session.closed:
+            return
+
+        self._release_stale_resources(loop)
+        self._loop = loop
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+        )
+        self._credential = DefaultAzureCredential()
+        self._token_lock = asyncio.Lock()
+        self._token = None
+        self._token_expires_on = 0.0
+        self._shutdown_guard = loop.create_task(self._close_on_loop_shutdown())
+
+    def _release_stale_resources(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Close the session and credential left over from a previous loop."""
+        session, credential, old_loop = self._session, self._credential, self._loop
+        self._session = None
+        self._credential = None
+        self._shutdown_guard = None
+        if session is None and credential is None:
+            return
+
+        if old_loop is not None and old_loop is not loop and old_loop.is_running() and not old_loop.is_closed():
+            # Still serving another thread: close on the loop that owns them
+            asyncio.run_coroutine_threadsafe(_close_resources(session, credential), old_loop)
+            return
+
+        # The owning loop is gone: close them from the current loop
+        task = loop.create_task(_close_resources(session, credential))
+        self._pending_closes.add(task)
+        task.add_done_callback(self._pending_closes.discard)
+
+    async def _close_on_loop_shutdown(self) -> None:
+        """Wait until the owning loop cancels its tasks at shutdown, then close."""
+        try:
+            await asyncio.get_running_loop().create_future()
+        except asyncio.CancelledError:
+            if self._shutdown_guard is asyncio.current_task():
+                self._shutdown_guard = None
+                await self.close()
+            raise
+
+    async def _get_token(self) -> str:
+        """Return a cached access token, refreshing it shortly before expiry."""
+        if self._token and time.time() < self._token_expires_on - TOKEN_REFRESH_MARGIN_SECONDS:
+            return self._token
+
+        async with self._token_lock:
+            # Another request may have refreshed the token while we waited
+            if self._token and time.time() < self._token_expires_on - TOKEN_REFRESH_MARGIN_SECONDS:
+                return self._token
+            access_token = await self._credential.get_token(TOKEN_SCOPE)
+            self._token = access_token.token
+            self._token_expires_on = access_token.expires_on
+            return self._token
+
+    def invalidate_token(self) -> None:
+        """Drop the cached token so the next call fetches a new one."""
+        self._token = None
+        self._token_expires_on = 0.0
+
+    async def shield_prompt(
+        self,
+        user_prompt: str,
+        documents: list[str] | None = None,
+        timeout: float | None = None
+    ) -> dict:
+        """
+        Call text:shieldPrompt and return the parsed JSON response.
+
+        Args:
+            user_prompt: Text to analyze as the user prompt
+            documents: Optional document texts to analyze
+            timeout: Total seconds allowed for the HTTP call
+
+        Returns:
+            Parsed response body
+
+        Raises:
+            PromptShieldsError: If the API returns a non-200 status
+        """
+        self._bind_to_running_loop()
+        token = await self._get_token()
+
+        request_body = {
+            "userPrompt": user_prompt,
+            "documents": documents or []
+        }
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+
+        async with self._session.post(
+            self.api_url,
+            json=request_body,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            if response.status == 200:
+                return await response.json()
+            if response.status == 401:
+                self.invalidate_token()
+            raise PromptShieldsError(response.status, await response.text())
+
+    async def close(self) -> None:
+        """Close the pooled session and credential."""
+        guard, self._shutdown_guard = self._shutdown_guard, None
+        if guard is not None and guard is not asyncio.current_task():
+            guard.cancel()
+        await _close_resources(self._session, self._credential)
+        self._session = None
+        self._credential = None
+        self._loop = None
+        self.invalidate_token()
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share a cache entry."""
+    return " ".join(text.split())
+
+
+def prompt_cache_key(text: str) -> str:
+    """
+    Build the verdict cache key for a combined prompt.
+
+    Args:
+        text: The combined prompt sent to Prompt Shields
+
+    Returns:
+        Hex SHA-256 digest of the normalized prompt
+    """
+    return hashlib.sha256(normalize_prompt(text).encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Bounded LRU cache with per-entry TTL for Prompt Shields verdicts.
+
+    Keys are prompt hashes (see prompt_cache_key) so raw user text is never
+    held in memory longer than the request. With safe_only enabled, only
+    "no attack" verdicts are cached and attacks are always re-checked.
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        ttl_seconds: float = DEFAULT_CACHE_TTL_SECONDS,
+        safe_only: bool = False,
+        stats_interval: int = DEFAULT_CACHE_STATS_INTERVAL
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.safe_only = safe_only
+        self.stats_interval = stats_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_reported = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached verdict for key, or None on miss/expiry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, verdict = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return verdict
+
+    def put(self, key: str, verdict: Any) -> None:
+        """Store a verdict, evicting the least recently used entry if full."""
+        if self.max_size <= 0:
+            return
+        if self.safe_only and not getattr(verdict, "is_safe", False):
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def should_report(self) -> bool:
+        """True every stats_interval lookups, for periodic stats logging."""
+        lookups = self.hits + self.misses
+        if self.stats_interval <= 0 or lookups - self._last_reported < self.stats_interval:
+            return False
+        self._last_reported = lookups
+        return True
+
+    def stats(self) -> dict[str, int | float]:
+        """Return hit/miss counters for telemetry."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Drop all entries and reset counters."""
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = self._last_reported = 0
+
+
+def gateway_cleared_arguments(body: Any) -> dict[str, str]:
+    """
+    Return the tool arguments the mcp-content-safety fragment sends to Prompt Shields.
+
+    The fragment analyzes params.arguments of tools/call requests; its
+    verdict covers the top-level string values, so only those are vouched
+    for. Tool names, nested values and other fields are not.
+
+    Args:
+        body: Parsed JSON request body
+
+    Returns:
+        Argument name -> value, in body order (empty if nothing qualifies)
+    """
+    if not isinstance(body, dict) or body.get("method") != "tools/call":
+        return {}
+    params = body.get("params")
+    arguments = params.get("arguments") if isinstance(params, dict) else None
+    if not isinstance(arguments, dict):
+        return {}
+    return {str(k): v for k, v in arguments.items() if isinstance(v, str)}
+
+
+def gateway_verdict_signature(key: str, arguments: dict[str, str]) -> str:
+    """
+    Sign the arguments a gateway verdict covers, as the policy fragment does.
+
+    Every name and value is written as a netstring ("<utf-8 length>:<text>,")
+    so the message is unambiguous, then signed with HMAC-SHA256.
+
+    Args:
+        key: Shared secret (GATEWAY_VERDICT_KEY / gateway-verdict-key)
+        arguments: Output of gateway_cleared_arguments
+
+    Returns:
+        Header value in the "hmac-sha256:<hex>" form
+    """
+    message = bytearray()
+    for name, value in arguments.items():
+        for part in (name, value):
+            encoded = part.encode("utf-8", errors="surrogatepass")
+            message += f"{len(encoded)}:".encode() + encoded + b","
+    digest = hmac.new(key.encode("utf-8"), bytes(message), hashlib.sha256).hexdigest()
+    return GATEWAY_VERDICT_PREFIX + digest
+
+
+def gateway_cleared_texts(header_value: str | None, body: Any) -> frozenset[str]:
+    """
+    Return the texts APIM already cleared with Prompt Shields for this request.
+
+    The mcp-content-safety fragment signs the argument values it analyzed
+    with a key shared only with this function (APIM secret named value
+    gateway-verdict-key, app setting GATEWAY_VERDICT_KEY) and forwards the
+    signature on the send-request to /api/input-check. The header is only
+    honored when TRUST_GATEWAY_PROMPT_SHIELDS is "true", the key is set and
+    the signature matches the arguments received, so callers that reach the
+    function directly cannot forge a verdict. Only the signed values are
+    returned; everything else extracted from the body still goes to Layer 2.
+
+    Args:
+        header_value: Value of the x-prompt-shields-cleared header, if any
+        body: Parsed JSON request body
+
+    Returns:
+        Argument values whose Prompt Shields check can be skipped
+    """
+    if not header_value or not header_value.startswith(GATEWAY_VERDICT_PREFIX):
+        return frozenset()
+    if os.environ.get("TRUST_GATEWAY_PROMPT_SHIELDS", "false").lower() != "true":
+        return frozenset()
+    key = os.environ.get("GATEWAY_VERDICT_KEY", "")
+    if not key:
+        logger.warning("TRUST_GATEWAY_PROMPT_SHIELDS is set but GATEWAY_VERDICT_KEY is not, ignoring gateway verdict")
+        return frozenset()
+
+    arguments = gateway_cleared_arguments(body)
+    if not arguments:
+        return frozenset()
+    expected = gateway_verdict_signature(key, arguments)
+    if not hmac.compare_digest(header_value.strip().lower(), expected):
+        return frozenset()
+    return frozenset(arguments.values())
+
+
+_client: PromptShieldsClient | None = None
+_verdict_cache: VerdictCache | None = None
+
+
+def get_prompt_shields_client() -> PromptShieldsClient | None:
+    """
+    Get the process-wide Prompt Shields client.
+
+    Returns:
+        PromptShieldsClient or None if CONTENT_SAFETY_ENDPOINT is not configured
+    """
+    global _client
+
+    # Prompt Shields requires the Content Safety endpoint, not the generic AI Services endpoint
+    endpoint = os.environ.get("CONTENT_SAFETY_ENDPOINT")
+    if not endpoint:
+        return None
+
+    if _client is None or _client.endpoint != endpoint.rstrip('/'):
+        max_connections = int(os.environ.get("PROMPT_SHIELDS_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS))
+        _client = PromptShieldsClient(endpoint, max_connections=max_connections)
+    return _client
+
+
+def get_verdict_cache() -> VerdictCache | None:
+    """
+    Get the process-wide Prompt Shields verdict cache.
+
+    Configured from PROMPT_SHIELDS_CACHE_SIZE, PROMPT_SHIELDS_CACHE_TTL_SECONDS
+    and PROMPT_SHIELDS_CACHE_SAFE_ONLY on first use.
+
+    Returns:
+        VerdictCache or None if caching is disabled (size 0)
+    """
+    global _verdict_cache
+
+    if _verdict_cache is None:
+        max_size = int(os.environ.get("PROMPT_SHIELDS_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        if max_size <= 0:
+            return None
+        _verdict_cache = VerdictCache(
+            max_size=max_size,
+            ttl_seconds=float(os.environ.get("PROMPT_SHIELDS_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS)),
+            safe_only=os.environ.get("PROMPT_SHIELDS_CACHE_SAFE_ONLY", "false").lower() == "true",
+            stats_interval=int(os.environ.get("PROMPT_SHIELDS_CACHE_STATS_INTERVAL", DEFAULT_CACHE_STATS_INTERVAL))
+        )
+    return _verdict_cache
+
+
+async def close_prompt_shields_client() -> None:
+    """Close the process-wide client, if one was created."""
+    global _client
+
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+@atexit.register
+def shutdown_prompt_shields_client() -> None:
+    """
+    Best-effort shutdown hook for the Functions worker process.
+
+    Closes the shared session on the loop that owns it when that loop is
+    still usable. A loop that was shut down normally has already closed
+    them through the client's shutdown guard.
+    """
+    if _client is None or _client._loop is None:
+        return
+
+    loop = _client._loop
+    if loop.is_closed() or loop.is_running():
+        return
+    try:
+        loop.run_until_complete(close_prompt_shields_client())
+    except Exception as e:
+        logger.warning(f"Failed to close Prompt Shields client: {e}")
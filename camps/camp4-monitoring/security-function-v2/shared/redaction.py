@@ -0,0 +1,128 @@
+"""
+Span-Based Redaction
+
+Detectors used to redact by rebuilding the string once per finding
+(text[:start] + label + text[end:]), which is O(n*k) and allocates k full
+copies of entity-dense responses. Detectors now report spans against the
+original text instead; overlapping spans are merged and the redacted text
+is produced in a single join pass.
+
+Precedence: overlapping spans of the same priority (e.g. one PII entity
+seen whole and cut at a chunk edge) are merged into their union, which
+takes the replacement (and finding) of the longest, then the earliest
+reported. Across priorities the span with the lowest priority value wins
+and keeps its own extent; an overlapping span of a later priority is
+dropped rather than merged, because its replacement would otherwise be
+stretched over text it never matched (an entropy token covering
+"client_secret=..." would turn "client_secret=[REDACTED-SECRET]" into
+"secret=[REDACTED-SECRET]").
+"""
+
+import bisect
+from typing import Any, NamedTuple
+
+
+class Span(NamedTuple):
+    """A region of the original text to replace."""
+    start: int
+    end: int
+    replacement: str
+    priority: int
+    finding: Any
+
+
+def _union_overlaps(spans: list[Span]) -> list[Span]:
+    # Spans of one priority: overlapping ones merge into their union
+    merged: list[Span] = []
+    # Within one start, the longest span comes first (stable sort keeps
+    # report order as the last tie-breaker)
+    for span in sorted(spans, key=lambda s: (s.start, s.start - s.end)):
+        if merged and span.start < merged[-1].end:
+            last = merged[-1]
+            winner = span if span.start - span.end < last.start - last.end else last
+            merged[-1] = winner._replace(start=last.start, end=max(last.end, span.end))
+            continue
+        merged.append(span)
+    return merged
+
+
+def merge_spans(spans: list[Span]) -> list[Span]:
+    """
+    Merge overlapping spans using the precedence rule.
+    
+    Args:
+        spans: Spans in any order, possibly overlapping
+        
+    Returns:
+        Non-overlapping spans sorted by start
+    """
+    by_priority: dict[int, list[Span]] = {}
+    for span in spans:
+        by_priority.setdefault(span.priority, []).append(span)
+    
+    starts: list[int] = []
+    kept: list[Span] = []
+    for priority in sorted(by_priority):
+        for span in _union_overlaps(by_priority[priority]):
+            index = bisect.bisect_right(starts, span.start)
+            if index > 0 and kept[index - 1].end > span.start:
+                continue
+            if index < len(kept) and kept[index].start < span.end:
+                continue
+            starts.insert(index, span.start)
+            kept.insert(index, span)
+    return kept
+
+
+def apply_spans(text: str, spans: list[Span]) -> str:
+    """
+    Replace non-overlapping, sorted spans in one pass.
+    
+    Args:
+        text: The original text
+        spans: Output of merge_spans
+        
+    Returns:
+        The redacted text
+    """
+    parts = []
+    position = 0
+    for span in spans:
+        parts.append(text[position:span.start])
+        parts.append(span.replacement)
+        position = span.end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+class RedactionBuilder:
+    """
+    Collects spans from any number of detectors for one text.
+    
+    Example:
+        builder = RedactionBuilder(text)
+        builder.add(0, 5, "[REDACTED-Email]", finding={...})
+        redacted, spans = builder.build()
+    """
+    
+    def __init__(self, text: str):
+        self.text = text
+        self._spans: list[Span] = []
+    
+    def __len__(self) -> int:
+        return len(self._spans)
+    
+    def add(self, start: int, end: int, replacement: str, priority: int = 0, finding: Any = None) -> None:
+        """Record a span of the original text to replace (empty spans are ignored)."""
+        if end > start:
+            self._spans.append(Span(start, end, replacement, priority, finding))
+    
+    def build(self) -> tuple[str, list[Span]]:
+        """
+        Merge the collected spans and produce the redacted text.
+        
+        Returns:
+            Tuple of (redacted text, merged spans sorted by start)
+        """
+        spans = merge_spans(self._spans)
+        return apply_spans(self.text, spans), spans
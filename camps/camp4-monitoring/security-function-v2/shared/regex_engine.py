@@ -0,0 +1,144 @@
+"""
+Regex Engine Selection for Detection Patterns
+
+Some detection patterns (e.g. ".*" between literals, or the PEM private key
+pattern with "[\\s\\S]*?") backtrack heavily on adversarial input with
+Python's built-in engine, letting a crafted request burn Function CPU.
+This module compiles detection patterns with a configurable engine:
+
+- "re": Python's built-in backtracking engine (default)
+- "re2": google-re2, guaranteed linear-time matching
+- "regex": the regex module with a per-match time limit
+
+Select with the DETECTION_REGEX_ENGINE app setting. The optional engines
+are only imported when selected; if one is not installed (or cannot
+compile a given pattern), the built-in engine is used with a warning.
+"""
+
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENGINE_RE = "re"
+ENGINE_RE2 = "re2"
+ENGINE_REGEX = "regex"
+
+# Per-match time limit for the "regex" engine
+DEFAULT_MATCH_TIMEOUT_SECONDS = 0.1
+
+
+class RegexTimeoutError(Exception):
+    """Raised when a match exceeds the per-match time limit."""
+
+
+def get_engine_name() -> str:
+    """Engine selected by the DETECTION_REGEX_ENGINE app setting."""
+    return os.environ.get("DETECTION_REGEX_ENGINE", ENGINE_RE).lower()
+
+
+def inline_flags(flags: int) -> str:
+    """Translate re flags into an inline flag group, e.g. "(?im)"."""
+    letters = ""
+    if flags & re.IGNORECASE:
+        letters += "i"
+    if flags & re.MULTILINE:
+        letters += "m"
+    if flags & re.DOTALL:
+        letters += "s"
+    return f"(?{letters})" if letters else ""
+
+
+class TimedPattern:
+    """
+    Compiled pattern from the regex module with a per-match time limit.
+
+    Exposes the subset of the re.Pattern API used by the detectors and
+    raises RegexTimeoutError when a call runs over the limit.
+    """
+
+    def __init__(self, compiled, timeout: float):
+        self._compiled = compiled
+        self.pattern = compiled.pattern
+        self.timeout = timeout
+
+    def search(self, text: str):
+        try:
+            return self._compiled.search(text, timeout=self.timeout)
+        except TimeoutError as e:
+            raise RegexTimeoutError(f"Pattern exceeded {self.timeout}s: {self.pattern[:50]}") from e
+
+    def finditer(self, text: str):
+        try:
+            # Materialize so the time limit covers the whole scan
+            return iter(list(self._compiled.finditer(text, timeout=self.timeout)))
+        except TimeoutError as e:
+            raise RegexTimeoutError(f"Pattern exceeded {self.timeout}s: {self.pattern[:50]}") from e
+
+    def sub(self, replacement: str, text: str) -> str:
+        try:
+            return self._compiled.sub(replacement, text, timeout=self.timeout)
+        except TimeoutError as e:
+            raise RegexTimeoutError(f"Pattern exceeded {self.timeout}s: {self.pattern[:50]}") from e
+
+
+_warned: set[str] = set()
+
+
+def _fallback(engine: str, reason: str):
+    """Log once per engine/reason that the built-in engine is being used."""
+    key = f"{engine}:{reason}"
+    if key not in _warned:
+        _warned.add(key)
+        logger.warning(f"Regex engine '{engine}' unavailable ({reason}), using built-in re")
+
+
+def compile_pattern(pattern: str, flags: int = 0, engine: str | None = None):
+    """
+    Compile a detection pattern with the selected engine.
+
+    Args:
+        pattern: The regex pattern
+        flags: re module flags (IGNORECASE, MULTILINE, DOTALL are supported
+            by every engine)
+        engine: Engine name; defaults to DETECTION_REGEX_ENGINE
+
+    Returns:
+        Compiled pattern exposing search, finditer and sub
+
+    Raises:
+        re.error: If the pattern is invalid
+    """
+    if engine is None:
+        engine = get_engine_name()
+
+    if engine == ENGINE_RE2:
+        try:
+            import re2
+        except ImportError:
+            _fallback(engine, "google-re2 not installed")
+        else:
+            try:
+                return re2.compile(inline_flags(flags) + pattern)
+            except Exception as e:
+                # RE2 has no backreferences/lookarounds; keep such patterns on re
+                logger.warning(f"RE2 cannot compile {pattern[:50]!r} ({e}), using built-in re")
+
+    elif engine == ENGINE_REGEX:
+        try:
+            import regex
+        except ImportError:
+            _fallback(engine, "regex not installed")
+        else:
+            timeout = float(os.environ.get("REGEX_MATCH_TIMEOUT_SECONDS", DEFAULT_MATCH_TIMEOUT_SECONDS))
+            try:
+                compiled = regex.compile(pattern, flags | regex.VERSION0)
+            except regex.error as e:
+                raise re.error(str(e), pattern) from e
+            return TimedPattern(compiled, timeout)
+
+    elif engine != ENGINE_RE:
+        _fallback(engine, "unknown engine")
+
+    return re.compile(pattern, flags)
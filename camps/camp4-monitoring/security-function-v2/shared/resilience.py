@@ -0,0 +1,182 @@
+"""
+Resilience Module for Outbound Service Calls
+
+Keeps a degraded Content Safety or Language endpoint from stalling every
+request until APIM's 10 second send-request timeout:
+- Deadline: a per-request time budget passed down through the input-check
+  and sanitize-output pipelines, so every outbound call gets only the time
+  that is left
+- CircuitBreaker: stops calling a dependency after repeated failures and
+  short-circuits (fail open or fail closed by config) until it recovers
+
+Breaker state transitions are logged through security_logger so they show
+up in the security dashboards next to the request events.
+"""
+
+import os
+import logging
+import time
+
+from .security_logger import log_circuit_state_change
+
+logger = logging.getLogger(__name__)
+
+# Default per-request budget, kept below APIM's 10s send-request timeout
+DEFAULT_REQUEST_BUDGET_SECONDS = 8.0
+
+# Circuit breaker defaults (overridable via app settings)
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT_SECONDS = 30.0
+
+
+class Deadline:
+    """
+    Absolute deadline for one request, shared by every outbound call it makes.
+
+    Carries the request's correlation ID so components deep in the pipeline
+    can attribute breaker events to the request that triggered them.
+    """
+
+    def __init__(self, seconds: float, correlation_id: str = ""):
+        self.expires_at = time.monotonic() + seconds
+        self.correlation_id = correlation_id
+
+    @classmethod
+    def for_request(cls, correlation_id: str = "") -> "Deadline":
+        """Create a deadline using the SECURITY_REQUEST_BUDGET_SECONDS app setting."""
+        seconds = float(os.environ.get("SECURITY_REQUEST_BUDGET_SECONDS", DEFAULT_REQUEST_BUDGET_SECONDS))
+        return cls(seconds, correlation_id)
+
+    def remaining(self) -> float:
+        """Seconds left in the budget (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """True once the budget is used up."""
+        return self.remaining() <= 0.0
+
+
+class CircuitState:
+    """Constants for circuit breaker states."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one outbound dependency.
+
+    - closed: calls flow; failure_threshold consecutive failures open it
+    - open: calls are short-circuited for reset_timeout seconds
+    - half_open: a single trial call is allowed; success closes the
+      circuit, failure opens it again
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT_SECONDS,
+        fail_closed: bool = False
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.fail_closed = fail_closed
+        self.state = CircuitState.CLOSED
+        self.failure_count = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def _transition(self, new_state: str, correlation_id: str) -> None:
+        if new_state == self.state:
+            return
+        previous = self.state
+        self.state = new_state
+        log_circuit_state_change(
+            breaker_name=self.name,
+            previous_state=previous,
+            new_state=new_state,
+            failure_count=self.failure_count,
+            correlation_id=correlation_id
+        )
+
+    def allow_request(self, correlation_id: str = "") -> bool:
+        """
+        Check whether a call to the dependency may be attempted.
+
+        Args:
+            correlation_id: Correlation ID of the calling request
+
+        Returns:
+            False when the circuit is open (caller should short-circuit)
+        """
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._transition(CircuitState.HALF_OPEN, correlation_id)
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+
+        return True
+
+    def record_success(self, correlation_id: str = "") -> None:
+        """Record a successful call."""
+        self._trial_in_flight = False
+        self.failure_count = 0
+        self._transition(CircuitState.CLOSED, correlation_id)
+
+    def release_trial(self) -> None:
+        """
+        Give back a half-open trial whose call ended without an outcome.
+
+        Used when the caller is cancelled mid-call (e.g. a speculative check
+        that lost the race) so the next request can run the trial instead of
+        the circuit staying half-open with no call in flight.
+        """
+        self._trial_in_flight = False
+
+    def record_failure(self, correlation_id: str = "") -> None:
+        """Record a failed or timed-out call."""
+        self._trial_in_flight = False
+        self.failure_count += 1
+        if self.state == CircuitState.HALF_OPEN or self.failure_count >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._transition(CircuitState.OPEN, correlation_id)
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str, fail_mode_setting: str | None = None) -> CircuitBreaker:
+    """
+    Get (or lazily create) the process-wide breaker for a dependency.
+
+    Thresholds come from CIRCUIT_BREAKER_FAILURE_THRESHOLD and
+    CIRCUIT_BREAKER_RESET_SECONDS. The fail mode is read from
+    fail_mode_setting (e.g. PROMPT_SHIELDS_FAIL_MODE): "closed" blocks
+    requests while the dependency is unavailable, anything else fails open.
+
+    Args:
+        name: Dependency name used in logs (e.g. "prompt_shields")
+        fail_mode_setting: App setting holding "open" or "closed"
+
+    Returns:
+        CircuitBreaker shared by all requests in this worker
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        fail_mode = os.environ.get(fail_mode_setting, "open") if fail_mode_setting else "open"
+        breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.environ.get("CIRCUIT_BREAKER_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)),
+            reset_timeout=float(os.environ.get("CIRCUIT_BREAKER_RESET_SECONDS", DEFAULT_RESET_TIMEOUT_SECONDS)),
+            fail_closed=fail_mode.lower() == "closed"
+        )
+        _breakers[name] = breaker
+    return breaker
@@ -0,0 +1,305 @@
+"""
+Hot-Reloadable Detection Rule Packs
+
+Injection and credential patterns can be shipped as a versioned JSON rule
+pack instead of being baked into the code, so a pattern change does not
+require redeploying the Function App:
+
+    {
+      "version": "2026.10.1",
+      "injection_patterns": {
+        "shell_injection": [{"pattern": "[;&|`]", "description": "..."}]
+      },
+      "credential_patterns": [
+        {"pattern": "...", "type": "API_KEY", "replacement": "..."}
+      ]
+    }
+
+RULE_PACK_PATH points at the pack (e.g. a file on a mounted Azure Files
+share). The pack is validated, then compiled once per worker into a
+CompiledRulePack that is swapped in with a single reference assignment, so
+each scan sees one consistent pack. The file is re-checked at most every
+RULE_PACK_CHECK_INTERVAL_SECONDS; an invalid update (including one that
+only fails when compiled into the combined matcher) is logged and the
+previous pack stays active. Without RULE_PACK_PATH the built-in patterns
+are used (version "builtin").
+
+Validate a pack or export the built-in patterns as a starting point:
+
+    python -m shared.rule_packs validate pack.json
+    python -m shared.rule_packs export > pack.json
+"""
+
+import json
+import os
+import re
+import sys
+import logging
+import threading
+import time
+from typing import Any, NamedTuple
+
+from .security_logger import log_rule_pack_loaded, log_security_error, set_rule_pack_version
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_VERSION = "builtin"
+DEFAULT_CHECK_INTERVAL_SECONDS = 30.0
+
+
+class RulePackError(ValueError):
+    """Raised when a rule pack cannot be read or fails validation."""
+
+
+class RulePack(NamedTuple):
+    """Validated rule pack contents, in the shapes the detectors use."""
+    version: str
+    source: str
+    injection_patterns: dict[str, list[tuple[str, str]]]
+    credential_patterns: list[tuple[str, str, str]]
+
+
+class CompiledRulePack(NamedTuple):
+    """A rule pack compiled for matching; the unit that is swapped atomically."""
+    version: str
+    source: str
+    injection_engine: Any  # InjectionRuleEngine
+    credential_patterns: list[tuple[re.Pattern, str, str, str]]
+
+
+def _require_str(entry: dict, key: str, where: str) -> str:
+    value = entry.get(key) if isinstance(entry, dict) else None
+    if not isinstance(value, str) or not value:
+        raise RulePackError(f"{where}: '{key}' must be a non-empty string")
+    return value
+
+
+def _require_pattern(entry: dict, where: str) -> str:
+    pattern = _require_str(entry, "pattern", where)
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise RulePackError(f"{where}: invalid pattern {pattern!r}: {e}") from e
+    return pattern
+
+
+def parse_rule_pack(data: Any, source: str) -> RulePack:
+    """
+    Validate decoded rule pack JSON.
+
+    Args:
+        data: Decoded JSON document
+        source: Where the pack came from (used in errors and logs)
+
+    Returns:
+        RulePack with patterns in the detector tuple formats
+
+    Raises:
+        RulePackError: If a field is missing, mistyped, or a pattern is invalid
+    """
+    if not isinstance(data, dict):
+        raise RulePackError(f"{source}: rule pack must be a JSON object")
+    version = _require_str(data, "version", source)
+
+    injection = data.get("injection_patterns")
+    if not isinstance(injection, dict) or not injection:
+        raise RulePackError(f"{source}: 'injection_patterns' must be a non-empty object")
+    injection_patterns: dict[str, list[tuple[str, str]]] = {}
+    for category, rules in injection.items():
+        if not isinstance(rules, list):
+            raise RulePackError(f"{source}: injection_patterns.{category} must be a list")
+        injection_patterns[category] = [
+            (
+                _require_pattern(rule, f"{source}: injection_patterns.{category}[{i}]"),
+                _require_str(rule, "description", f"{source}: injection_patterns.{category}[{i}]")
+            )
+            for i, rule in enumerate(rules)
+        ]
+
+    credentials = data.get("credential_patterns")
+    if not isinstance(credentials, list):
+        raise RulePackError(f"{source}: 'credential_patterns' must be a list")
+    credential_patterns = []
+    for i, rule in enumerate(credentials):
+        where = f"{source}: credential_patterns[{i}]"
+        replacement = rule.get("replacement") if isinstance(rule, dict) else None
+        if not isinstance(replacement, str):
+            raise RulePackError(f"{where}: 'replacement' must be a string")
+        credential_patterns.append((
+            _require_pattern(rule, where),
+            _require_str(rule, "type", where),
+            replacement
+        ))
+
+    return RulePack(version, source, injection_patterns, credential_patterns)
+
+
+def load_rule_pack(path: str) -> RulePack:
+    """
+    Read and validate a rule pack file.
+
+    Args:
+        path: Path to the JSON rule pack
+
+    Returns:
+        Validated RulePack
+
+    Raises:
+        RulePackError: If the file cannot be read, parsed, or validated
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise RulePackError(f"{path}: {e}") from e
+    return parse_rule_pack(data, path)
+
+
+def builtin_rule_pack() -> RulePack:
+    """The patterns shipped in injection_patterns.py and credential_scanner.py."""
+    from .credential_scanner import CREDENTIAL_PATTERNS
+    from .injection_patterns import INJECTION_PATTERNS
+    return RulePack(BUILTIN_VERSION, BUILTIN_VERSION, INJECTION_PATTERNS, CREDENTIAL_PATTERNS)
+
+
+def export_rule_pack(pack: RulePack) -> dict:
+    """Convert a RulePack back to its JSON document form."""
+    return {
+        "version": pack.version,
+        "injection_patterns": {
+            category: [{"pattern": p, "description": d} for p, d in rules]
+            for category, rules in pack.injection_patterns.items()
+        },
+        "credential_patterns": [
+            {"pattern": p, "type": t, "replacement": r} for p, t, r in pack.credential_patterns
+        ],
+    }
+
+
+def compile_rule_pack(pack: RulePack) -> CompiledRulePack:
+    """
+    Compile a validated pack with the configured regex engine.
+
+    Args:
+        pack: Validated RulePack
+
+    Returns:
+        CompiledRulePack ready to be activated
+        
+    Raises:
+        RulePackError: If the patterns cannot be compiled into a matcher
+    """
+    from .credential_scanner import compile_credential_patterns
+    from .injection_patterns import InjectionRuleEngine
+    try:
+        injection_engine = InjectionRuleEngine(pack.injection_patterns)
+    except re.error as e:
+        raise RulePackError(f"{pack.source}: injection patterns cannot be combined: {e}") from e
+    return CompiledRulePack(
+        version=pack.version,
+        source=pack.source,
+        injection_engine=injection_engine,
+        credential_patterns=compile_credential_patterns(pack.credential_patterns)
+    )
+
+
+_active: CompiledRulePack | None = None
+_file_state: tuple[int, int] | None = None
+_next_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def _activate(compiled: CompiledRulePack, correlation_id: str) -> None:
+    global _active
+    previous = _active
+    _active = compiled
+    set_rule_pack_version(compiled.version)
+    log_rule_pack_loaded(
+        version=compiled.version,
+        source=compiled.source,
+        previous_version=previous.version if previous else None,
+        correlation_id=correlation_id
+    )
+
+
+def _refresh(correlation_id: str) -> None:
+    global _file_state, _next_check
+    _next_check = time.monotonic() + float(
+        os.environ.get("RULE_PACK_CHECK_INTERVAL_SECONDS", DEFAULT_CHECK_INTERVAL_SECONDS)
+    )
+
+    path = os.environ.get("RULE_PACK_PATH")
+    if path:
+        try:
+            stat = os.stat(path)
+            state = (stat.st_mtime_ns, stat.st_size)
+            if state != _file_state or _active is None:
+                compiled = compile_rule_pack(load_rule_pack(path))
+                _file_state = state
+                _activate(compiled, correlation_id)
+            return
+        except (OSError, RulePackError) as e:
+            # Keep serving with the last good pack
+            log_security_error(
+                error_message=f"Rule pack reload failed: {e}",
+                correlation_id=correlation_id,
+                error_type="rule_pack_error"
+            )
+
+    if _active is None:
+        _activate(compile_rule_pack(builtin_rule_pack()), correlation_id)
+
+
+def get_active_rule_pack(correlation_id: str = "") -> CompiledRulePack:
+    """
+    Get the active compiled rule pack, reloading it if the file changed.
+
+    The file is stat-ed at most once per check interval; only one thread
+    reloads while others keep using the current pack.
+
+    Args:
+        correlation_id: Correlation ID of the calling request (for reload logs)
+
+    Returns:
+        The active CompiledRulePack
+    """
+    if _active is None or time.monotonic() >= _next_check:
+        # Block only when there is no pack to serve yet
+        if _reload_lock.acquire(blocking=_active is None):
+            try:
+                if _active is None or time.monotonic() >= _next_check:
+                    _refresh(correlation_id)
+            finally:
+                _reload_lock.release()
+    return _active
+
+
+def reload_rule_pack(correlation_id: str = "") -> CompiledRulePack:
+    """Check the rule pack file now instead of waiting for the interval."""
+    global _next_check
+    _next_check = 0.0
+    return get_active_rule_pack(correlation_id)
+
+
+def main(argv: list[str]) -> int:
+    """Command line entry point: validate <path> | export."""
+    if len(argv) == 2 and argv[0] == "validate":
+        try:
+            pack = load_rule_pack(argv[1])
+            # Build the matcher the detectors use, not just each pattern alone
+            compile_rule_pack(pack)
+        except RulePackError as e:
+            print(f"Invalid rule pack: {e}", file=sys.stderr)
+            return 1
+        rules = sum(len(r) for r in pack.injection_patterns.values()) + len(pack.credential_patterns)
+        print(f"Rule pack {pack.version} OK ({rules} rules)")
+        return 0
+    if argv == ["export"]:
+        print(json.dumps(export_rule_pack(builtin_rule_pack()), indent=2))
+        return 0
+    print("usage: python -m shared.rule_packs validate <path> | export", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
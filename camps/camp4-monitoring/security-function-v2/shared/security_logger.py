@@ -10,6 +10,12 @@ Event types align with security function operations:
 - CREDENTIAL_DETECTED: Credential patterns found and redacted
 - INPUT_CHECK_PASSED: Request passed all security checks
 - SECURITY_ERROR: Security function encountered an error
+- CACHE_STATS: Periodic hit/miss counters for detection caches
+- CIRCUIT_STATE_CHANGED: A dependency circuit breaker opened or closed
+- RULE_PACK_LOADED: A detection rule pack was activated
+- RISK_GATE_SHADOW_MISS: The local risk gate would have skipped a real attack
+
+Every event carries the version of the active detection rule pack.
 """
 
 import os
@@ -53,6 +59,15 @@ def configure_telemetry():
 # Get logger after potential Azure Monitor configuration
 logger = logging.getLogger("security-function")
 
+# Version of the active detection rule pack, attached to every event
+_rule_pack_version = "builtin"
+
+
+def set_rule_pack_version(version: str) -> None:
+    """Record the active rule pack version for subsequent events."""
+    global _rule_pack_version
+    _rule_pack_version = version
+
 
 class SecurityEventType:
     """Constants for security event types used in structured logging."""
@@ -61,6 +76,10 @@ class SecurityEventType:
     CREDENTIAL_DETECTED = "CREDENTIAL_DETECTED"
     INPUT_CHECK_PASSED = "INPUT_CHECK_PASSED"
     SECURITY_ERROR = "SECURITY_ERROR"
+    CACHE_STATS = "CACHE_STATS"
+    CIRCUIT_STATE_CHANGED = "CIRCUIT_STATE_CHANGED"
+    RULE_PACK_LOADED = "RULE_PACK_LOADED"
+    RISK_GATE_SHADOW_MISS = "RISK_GATE_SHADOW_MISS"
 
 
 def generate_correlation_id() -> str:
@@ -99,6 +118,7 @@ def log_security_event(
         "severity": severity,
         "timestamp_utc": datetime.utcnow().isoformat(),
         "service": "security-function",
+        "rule_pack_version": _rule_pack_version,
     }
 
     if extra_dimensions:
@@ -242,3 +262,117 @@ def log_security_error(
         severity="ERROR",
         extra_dimensions=extra
     )
+
+
+def log_cache_stats(
+    cache_name: str,
+    stats: dict[str, int | float],
+    correlation_id: str
+) -> None:
+    """
+    Log hit/miss counters for a detection cache.
+
+    Args:
+        cache_name: Name of the cache (e.g., "prompt_shields_verdicts")
+        stats: Counters from the cache (hits, misses, evictions, size, hit_rate)
+        correlation_id: Request correlation ID that triggered the report
+    """
+    extra = {"cache_name": cache_name}
+    extra.update({f"cache_{key}": value for key, value in stats.items()})
+
+    log_security_event(
+        event_type=SecurityEventType.CACHE_STATS,
+        category="performance",
+        message=f"Cache stats for {cache_name}: {stats.get('hits', 0)} hits, {stats.get('misses', 0)} misses",
+        correlation_id=correlation_id,
+        severity="INFO",
+        extra_dimensions=extra
+    )
+
+
+def log_circuit_state_change(
+    breaker_name: str,
+    previous_state: str,
+    new_state: str,
+    failure_count: int,
+    correlation_id: str
+) -> None:
+    """
+    Log a circuit breaker state transition for an outbound dependency.
+
+    Args:
+        breaker_name: Dependency name (e.g., "prompt_shields", "pii_detection")
+        previous_state: State before the transition (closed, open, half_open)
+        new_state: State after the transition
+        failure_count: Consecutive failures at the time of the transition
+        correlation_id: Correlation ID of the request that caused the transition
+    """
+    log_security_event(
+        event_type=SecurityEventType.CIRCUIT_STATE_CHANGED,
+        category="dependency_health",
+        message=f"Circuit breaker {breaker_name}: {previous_state} -> {new_state}",
+        correlation_id=correlation_id,
+        severity="WARNING" if new_state == "open" else "INFO",
+        extra_dimensions={
+            "breaker_name": breaker_name,
+            "previous_state": previous_state,
+            "new_state": new_state,
+            "failure_count": failure_count
+        }
+    )
+
+
+def log_rule_pack_loaded(
+    version: str,
+    source: str,
+    previous_version: str | None,
+    correlation_id: str
+) -> None:
+    """
+    Log activation of a detection rule pack.
+
+    Args:
+        version: Version of the newly active pack
+        source: File path the pack was loaded from, or "builtin"
+        previous_version: Version that was active before, None at startup
+        correlation_id: Correlation ID of the request that triggered the reload
+    """
+    log_security_event(
+        event_type=SecurityEventType.RULE_PACK_LOADED,
+        category="configuration",
+        message=f"Rule pack {version} activated from {source}",
+        correlation_id=correlation_id,
+        severity="INFO",
+        extra_dimensions={
+            "rule_pack_source": source,
+            "previous_rule_pack_version": previous_version or ""
+        }
+    )
+
+
+def log_risk_gate_shadow_miss(
+    score: float,
+    threshold: float,
+    gate_stats: dict[str, int],
+    correlation_id: str
+) -> None:
+    """
+    Log a Prompt Shields detection the risk gate would have skipped.
+
+    Args:
+        score: Local risk score of the request
+        threshold: Configured gate threshold
+        gate_stats: Cumulative gate counters (evaluated, would_skip, missed_attacks)
+        correlation_id: Request correlation ID
+    """
+    extra = {"risk_score": round(score, 3), "risk_threshold": threshold}
+    extra.update({f"gate_{key}": value for key, value in gate_stats.items()})
+
+    log_security_event(
+        event_type=SecurityEventType.RISK_GATE_SHADOW_MISS,
+        category="prompt_injection",
+        message=f"Risk gate would have skipped a Prompt Shields detection (score {score:.2f} < {threshold})",
+        correlation_id=correlation_id,
+        severity="WARNING",
+        extra_dimensions=extra
+    )
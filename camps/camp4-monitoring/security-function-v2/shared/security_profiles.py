@@ -0,0 +1,129 @@
+"""
+Per-Tool Security Profiles for Input Checks
+
+Not every MCP request can carry prompt injection. The routing table maps a
+JSON-RPC method, or for tools/call the tool name, to the checks it needs:
+
+- bypass: protocol handshakes and listings with no user text
+  (initialize, tools/list...) are allowed without scanning
+- regex: low-risk tools whose arguments are short identifiers; only the
+  regex layer runs, saving the Prompt Shields round trip
+- full: regex + Prompt Shields (free-text tools, prompts, resources and
+  anything not in the table)
+
+The built-in table covers the Sherpa MCP server. SECURITY_PROFILES_PATH may
+point at a JSON file with the same shape ({"methods": {...}, "tools": {...},
+"default": "full"}) whose entries override the built-in ones.
+"""
+
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SecurityProfile:
+    """Constants for input-check security profiles."""
+    BYPASS = "bypass"
+    REGEX_ONLY = "regex"
+    FULL = "full"
+
+
+VALID_PROFILES = {SecurityProfile.BYPASS, SecurityProfile.REGEX_ONLY, SecurityProfile.FULL}
+
+DEFAULT_ROUTES: dict = {
+    "methods": {
+        "initialize": SecurityProfile.BYPASS,
+        "notifications/initialized": SecurityProfile.BYPASS,
+        "ping": SecurityProfile.BYPASS,
+        "tools/list": SecurityProfile.BYPASS,
+        "resources/list": SecurityProfile.BYPASS,
+        "prompts/list": SecurityProfile.BYPASS,
+    },
+    "tools": {
+        "get_weather": SecurityProfile.REGEX_ONLY,
+        "check_trail_conditions": SecurityProfile.REGEX_ONLY,
+        "get_gear_recommendations": SecurityProfile.REGEX_ONLY,
+        # Returns guide PII; keep every layer in front of it
+        "get_guide_contact": SecurityProfile.FULL,
+    },
+    "default": SecurityProfile.FULL,
+}
+
+
+def merge_routes(overrides: dict) -> dict:
+    """
+    Merge a routing override document over DEFAULT_ROUTES.
+
+    Args:
+        overrides: {"methods": {...}, "tools": {...}, "default": profile}
+
+    Returns:
+        The merged routing table
+
+    Raises:
+        ValueError: If a profile name is not one of VALID_PROFILES
+    """
+    routes = {
+        "methods": dict(DEFAULT_ROUTES["methods"]),
+        "tools": dict(DEFAULT_ROUTES["tools"]),
+        "default": DEFAULT_ROUTES["default"],
+    }
+    for section in ("methods", "tools"):
+        routes[section].update(overrides.get(section, {}))
+    routes["default"] = overrides.get("default", routes["default"])
+
+    profiles = [*routes["methods"].values(), *routes["tools"].values(), routes["default"]]
+    invalid = {p for p in profiles if p not in VALID_PROFILES}
+    if invalid:
+        raise ValueError(f"Unknown security profiles: {sorted(map(str, invalid))}")
+    return routes
+
+
+_routes: dict | None = None
+
+
+def get_routes() -> dict:
+    """
+    Get the routing table, loading SECURITY_PROFILES_PATH on first use.
+
+    An unreadable or invalid override file is logged and the built-in
+    table is used.
+
+    Returns:
+        Routing table with "methods", "tools" and "default"
+    """
+    global _routes
+    if _routes is None:
+        path = os.environ.get("SECURITY_PROFILES_PATH")
+        _routes = DEFAULT_ROUTES
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    _routes = merge_routes(json.load(f))
+            except (OSError, ValueError, AttributeError) as e:
+                logger.warning(f"Could not load security profiles from {path}: {e}")
+    return _routes
+
+
+def resolve_security_profile(body: dict) -> str:
+    """
+    Find the security profile for an MCP request.
+
+    Args:
+        body: Parsed JSON body of MCP request
+
+    Returns:
+        One of the SecurityProfile constants
+    """
+    routes = get_routes()
+    method = body.get("method")
+    if method == "tools/call":
+        params = body.get("params")
+        name = params.get("name") if isinstance(params, dict) else None
+        if isinstance(name, str) and name in routes["tools"]:
+            return routes["tools"][name]
+    elif isinstance(method, str) and method in routes["methods"]:
+        return routes["methods"][method]
+    return routes["default"]
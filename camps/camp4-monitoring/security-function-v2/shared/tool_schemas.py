@@ -0,0 +1,238 @@
+"""
+Tool Input Schemas for Schema-Aware Scanning
+
+Most tool arguments are drawn from small closed sets (a location, a trail
+id, a condition type) yet every one of them went through the full regex
+and Prompt Shields pipeline. Given the tools' input schemas, arguments whose
+value is proven harmless by the schema are skipped before scanning:
+
+- value is one of the property's "enum" (or its "const")
+- value fully matches a strict "pattern": anchored, built only from
+  literals, digit classes and explicit character sets that cannot produce
+  whitespace, quotes, shell/SQL metacharacters, path separators, escapes,
+  "_" (keyword rules such as xp_cmdshell need only word characters) or
+  repeated "-" (an SQL comment)
+
+Everything else, including values that fail validation, is scanned as
+free text, so a stale or incomplete schema only costs the fast path.
+
+Schemas are read once from TOOL_SCHEMAS_PATH (default: tool_schemas.json
+next to function_app.py), which may be a saved MCP "tools/list" result or
+the JSON-RPC response containing it.
+"""
+
+import json
+import os
+import re
+import logging
+from typing import NamedTuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOOL_SCHEMAS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tool_schemas.json"
+)
+
+# Characters that detection patterns rely on; a strict pattern must not be
+# able to produce any of them
+UNSAFE_PATTERN_CHARS = frozenset(" \t\r\n\f\v'\"`;&|$<>(){}[]\\/%.*?=~!#,+_")
+
+# Allowed only as a single top-level literal ("guide-001"), never from a
+# class or repeat, so a strict pattern cannot produce "--"
+LITERAL_ONLY_CHARS = frozenset("-")
+
+# \w is not safe: it includes "_", and word-only keywords trip SQL rules
+_SAFE_CATEGORIES = {sre_parse.CATEGORY_DIGIT}
+_ANCHORS_START = {sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING}
+_ANCHORS_END = {sre_parse.AT_END, sre_parse.AT_END_STRING}
+
+
+class ArgumentSchema(NamedTuple):
+    """The parts of a JSON schema used to clear values without scanning."""
+    enum: frozenset[str] | None
+    pattern: re.Pattern | None
+    properties: dict[str, "ArgumentSchema"]
+    items: "ArgumentSchema | None"
+
+    def clears(self, value: str) -> bool:
+        """True if the schema alone proves the string value harmless."""
+        if self.enum is not None and value in self.enum:
+            return True
+        return self.pattern is not None and self.pattern.fullmatch(value) is not None
+
+
+def _safe_nodes(nodes, top_level: bool = True) -> bool:
+    previous_literal_only = False
+    for op, av in nodes:
+        literal_only = op is sre_parse.LITERAL and chr(av) in LITERAL_ONLY_CHARS
+        if literal_only and (not top_level or previous_literal_only):
+            return False
+        previous_literal_only = literal_only
+        if op is sre_parse.LITERAL:
+            if chr(av) in UNSAFE_PATTERN_CHARS:
+                return False
+        elif op is sre_parse.IN:
+            for item_op, item_av in av:
+                if item_op is sre_parse.LITERAL:
+                    if chr(item_av) in UNSAFE_PATTERN_CHARS or chr(item_av) in LITERAL_ONLY_CHARS:
+                        return False
+                elif item_op is sre_parse.RANGE:
+                    low, high = item_av
+                    if any(low <= ord(c) <= high for c in UNSAFE_PATTERN_CHARS | LITERAL_ONLY_CHARS):
+                        return False
+                elif not (item_op is sre_parse.CATEGORY and item_av in _SAFE_CATEGORIES):
+                    # Negated sets, \s, \W...
+                    return False
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            if not _safe_nodes(av[2], top_level=False):
+                return False
+        elif op is sre_parse.SUBPATTERN:
+            if not _safe_nodes(av[-1], top_level=False):
+                return False
+        elif op is sre_parse.BRANCH:
+            if not all(_safe_nodes(branch, top_level=False) for branch in av[1]):
+                return False
+        elif op is not sre_parse.AT:
+            # ".", backreferences, lookarounds...
+            return False
+    return True
+
+
+def is_strict_pattern(pattern: str) -> bool:
+    """
+    Check whether a schema pattern only admits inert identifiers.
+
+    Args:
+        pattern: JSON schema "pattern" value
+
+    Returns:
+        True if the pattern is anchored at both ends and every character it
+        can match is outside UNSAFE_PATTERN_CHARS
+    """
+    try:
+        parsed = list(sre_parse.parse(pattern))
+    except re.error:
+        return False
+    if len(parsed) < 2:
+        return False
+    first, last = parsed[0], parsed[-1]
+    if not (first[0] is sre_parse.AT and first[1] in _ANCHORS_START):
+        return False
+    if not (last[0] is sre_parse.AT and last[1] in _ANCHORS_END):
+        return False
+    return _safe_nodes(parsed)
+
+
+def compile_argument_schema(schema) -> ArgumentSchema | None:
+    """
+    Reduce a JSON schema to an ArgumentSchema.
+
+    Args:
+        schema: JSON schema object for a value
+
+    Returns:
+        ArgumentSchema, or None if the schema has nothing usable
+    """
+    if not isinstance(schema, dict):
+        return None
+
+    enum = None
+    values = schema.get("enum")
+    if "const" in schema:
+        values = [schema["const"]]
+    if isinstance(values, list):
+        enum = frozenset(v for v in values if isinstance(v, str))
+
+    pattern = None
+    if isinstance(schema.get("pattern"), str) and is_strict_pattern(schema["pattern"]):
+        pattern = re.compile(schema["pattern"])
+
+    properties = {}
+    if isinstance(schema.get("properties"), dict):
+        for name, prop in schema["properties"].items():
+            compiled = compile_argument_schema(prop)
+            if compiled is not None:
+                properties[name] = compiled
+
+    items = compile_argument_schema(schema.get("items"))
+
+    if enum is None and pattern is None and not properties and items is None:
+        return None
+    return ArgumentSchema(enum, pattern, properties, items)
+
+
+def parse_tool_schemas(data) -> dict[str, ArgumentSchema]:
+    """
+    Build the per-tool schema table from a tools/list snapshot.
+
+    Args:
+        data: A tools/list result ({"tools": [...]}) or the JSON-RPC
+            response wrapping it ({"result": {"tools": [...]}})
+
+    Returns:
+        Mapping of tool name to the compiled schema of its arguments
+    """
+    if isinstance(data, dict) and isinstance(data.get("result"), dict):
+        data = data["result"]
+    tools = data.get("tools", []) if isinstance(data, dict) else []
+
+    schemas = {}
+    for tool in tools:
+        if not isinstance(tool, dict) or not isinstance(tool.get("name"), str):
+            continue
+        compiled = compile_argument_schema(tool.get("inputSchema"))
+        if compiled is not None:
+            schemas[tool["name"]] = compiled
+    return schemas
+
+
+_tool_schemas: dict[str, ArgumentSchema] | None = None
+
+
+def get_tool_schemas() -> dict[str, ArgumentSchema]:
+    """
+    Get the tool schema table, loading it on first use.
+
+    A missing or unreadable file disables the fast path (every argument is
+    scanned) rather than failing requests.
+
+    Returns:
+        Mapping of tool name to ArgumentSchema (empty if none configured)
+    """
+    global _tool_schemas
+    if _tool_schemas is None:
+        path = os.environ.get("TOOL_SCHEMAS_PATH", DEFAULT_TOOL_SCHEMAS_PATH)
+        try:
+            with open(path, encoding="utf-8") as f:
+                _tool_schemas = parse_tool_schemas(json.load(f))
+            logger.info(f"Loaded input schemas for {len(_tool_schemas)} tools from {path}")
+        except FileNotFoundError:
+            _tool_schemas = {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Could not load tool schemas from {path}: {e}")
+            _tool_schemas = {}
+    return _tool_schemas
+
+
+def get_arguments_schema(body: dict) -> ArgumentSchema | None:
+    """
+    Look up the arguments schema for a tools/call request.
+
+    Args:
+        body: Parsed JSON body of MCP request
+
+    Returns:
+        ArgumentSchema for the called tool, or None
+    """
+    params = body.get("params")
+    if body.get("method") != "tools/call" or not isinstance(params, dict):
+        return None
+    name = params.get("name")
+    if not isinstance(name, str):
+        return None
+    return get_tool_schemas().get(name)
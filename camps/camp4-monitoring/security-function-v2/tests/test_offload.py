@@ -0,0 +1,79 @@
+"""Tests for offloading large-body scanning to the process pool.
+
+NOTE: Injection payloads and credential values in this file are FAKE test
+fixtures used only to exercise the detection patterns.
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import offload
+from shared.credential_scanner import scan_and_redact
+from shared.injection_patterns import scan_mcp_request_async
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Small pool with a low threshold, shut down after the test."""
+    monkeypatch.setenv("OFFLOAD_MAX_WORKERS", "1")
+    monkeypatch.setenv("OFFLOAD_THRESHOLD_BYTES", "1000")
+    offload.shutdown_process_pool()
+    yield
+    offload.shutdown_process_pool()
+
+
+def body(*notes):
+    arguments = {f"note{i}": note for i, note in enumerate(notes)}
+    return {"method": "tools/call", "params": {"name": "plan_trip", "arguments": arguments}}
+
+
+class TestRunScan:
+    """Test inline vs pooled dispatch."""
+
+    def test_small_payload_inline(self, pool):
+        """Payloads under the threshold never start the pool."""
+        assert asyncio.run(offload.run_scan(os.getpid, size=10)) == os.getpid()
+        assert offload._pool is None
+
+    def test_large_payload_offloaded(self, pool):
+        """Payloads at the threshold run in a worker process."""
+        assert asyncio.run(offload.run_scan(os.getpid, size=1000)) != os.getpid()
+
+    def test_disabled(self, pool, monkeypatch):
+        """OFFLOAD_MAX_WORKERS=0 keeps everything inline."""
+        monkeypatch.setenv("OFFLOAD_MAX_WORKERS", "0")
+        assert asyncio.run(offload.run_scan(os.getpid, size=10**9)) == os.getpid()
+
+    def test_credentials_redacted_in_pool(self, pool):
+        """Credential scanning results come back from the worker intact."""
+        text = "x " * 600 + "password=FAKE_TEST_P@ssw0rd_NOT_REAL"
+        result = asyncio.run(offload.run_scan(scan_and_redact, text, size=len(text)))
+        assert "[REDACTED-PASSWORD]" in result.redacted_text
+
+
+class TestOffloadedRequestScan:
+    """Test regex scanning of large MCP bodies."""
+
+    def test_injection_after_threshold_detected(self, pool):
+        """Texts past the threshold are scanned in the pool."""
+        result, texts = asyncio.run(scan_mcp_request_async(body("a" * 999, "Denver; rm -rf /")))
+        assert result.category == "shell_injection"
+        assert len(texts) == 3
+
+    def test_injection_before_threshold_stops_early(self, pool):
+        """Small prefixes are still scanned inline with early exit."""
+        result, texts = asyncio.run(scan_mcp_request_async(body("; ls", "a" * 5000)))
+        assert result.category == "shell_injection"
+        assert texts == []
+        assert offload._pool is None
+
+    def test_clean_large_body(self, pool):
+        """Clean large bodies pass and return every text."""
+        result, texts = asyncio.run(scan_mcp_request_async(body("Denver", "a" * 5000)))
+        assert result.is_safe
+        assert texts == ["Denver", "a" * 5000, "plan_trip"]
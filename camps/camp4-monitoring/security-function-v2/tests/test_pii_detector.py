@@ -0,0 +1,438 @@
+"""Tests for PII detection through Azure AI Language.
+
+The Language service is replaced with a local fake; contact details in this
+file are FAKE test fixtures.
+"""
+
+import asyncio
+import json
+import pytest
+import re
+import sys
+import os
+from types import SimpleNamespace
+
+from azure.core.exceptions import ClientAuthenticationError
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import pii_detector, resilience
+from shared.pii_detector import (
+    detect_and_redact_json_pii_async,
+    detect_and_redact_pii,
+    detect_and_redact_pii_async,
+)
+
+FAKE_EMAIL = "jordan.rivers@example.com"
+
+
+class FakeCredential:
+    """Stands in for the Azure credential; records close()."""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeLanguageClient:
+    """Finds FAKE_EMAIL in every document; counts constructions."""
+
+    instances: list["FakeLanguageClient"] = []
+    error: Exception | None = None
+
+    def __init__(self, endpoint, credential):
+        self.endpoint = endpoint
+        self.credential = credential
+        self.calls = 0
+        self.batch_sizes: list[int] = []
+        self.documents: list[str] = []
+        FakeLanguageClient.instances.append(self)
+
+    def recognize_pii_entities(self, documents, **kwargs):
+        self.calls += 1
+        self.batch_sizes.append(len(documents))
+        self.documents.extend(documents)
+        if FakeLanguageClient.error is not None:
+            raise FakeLanguageClient.error
+        results = []
+        for document in documents:
+            if "BAD" in document:
+                results.append(SimpleNamespace(is_error=True, error="InvalidDocument", entities=[]))
+                continue
+            entities = [
+                SimpleNamespace(
+                    category="Email", subcategory=None, confidence_score=0.99,
+                    offset=match.start(), length=len(FAKE_EMAIL)
+                )
+                for match in re.finditer(re.escape(FAKE_EMAIL), document)
+            ]
+            results.append(SimpleNamespace(is_error=False, error=None, entities=entities))
+        return results
+
+    def close(self):
+        pass
+
+
+class FakeAsyncCredential(FakeCredential):
+    async def close(self):
+        self.closed = True
+
+
+class FakeAsyncLanguageClient(FakeLanguageClient):
+    """aio variant; tracks how many requests overlap."""
+
+    in_flight = 0
+    max_in_flight = 0
+
+    async def recognize_pii_entities(self, documents, **kwargs):
+        FakeAsyncLanguageClient.in_flight += 1
+        FakeAsyncLanguageClient.max_in_flight = max(
+            FakeAsyncLanguageClient.max_in_flight, FakeAsyncLanguageClient.in_flight
+        )
+        try:
+            await asyncio.sleep(0.01)
+            return FakeLanguageClient.recognize_pii_entities(self, documents, **kwargs)
+        finally:
+            FakeAsyncLanguageClient.in_flight -= 1
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_language(monkeypatch):
+    """Route the module's client construction to the fakes."""
+    monkeypatch.setenv("AI_SERVICES_ENDPOINT", "https://language.example.com")
+    monkeypatch.setattr(pii_detector, "TextAnalyticsClient", FakeLanguageClient)
+    monkeypatch.setattr(pii_detector, "_create_credential", FakeCredential)
+    monkeypatch.setattr(pii_detector, "AsyncTextAnalyticsClient", FakeAsyncLanguageClient)
+    monkeypatch.setattr(pii_detector, "_create_async_credential", FakeAsyncCredential)
+    monkeypatch.setattr(pii_detector, "_async_client", None)
+    monkeypatch.setattr(FakeAsyncLanguageClient, "max_in_flight", 0)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(FakeLanguageClient, "instances", [])
+    monkeypatch.setattr(FakeLanguageClient, "error", None)
+    pii_detector.reset_client()
+    yield
+    pii_detector.reset_client()
+
+
+class TestLanguageClient:
+    """Test reuse of the process-wide Language client."""
+
+    def test_client_reused_across_calls(self):
+        """Repeated sanitize calls share one client and credential."""
+        for _ in range(3):
+            result = detect_and_redact_pii(f"Contact {FAKE_EMAIL}")
+            assert result.redacted_text == "Contact [REDACTED-Email]"
+        assert len(FakeLanguageClient.instances) == 1
+        assert FakeLanguageClient.instances[0].calls == 3
+
+    def test_endpoint_change_rebuilds_client(self, monkeypatch):
+        """A new AI_SERVICES_ENDPOINT gets a new client; the old one is closed."""
+        first = pii_detector.get_client()
+        monkeypatch.setenv("AI_SERVICES_ENDPOINT", "https://other.example.com")
+        second = pii_detector.get_client()
+        assert second is not first
+        assert second.endpoint == "https://other.example.com"
+        assert first.credential.closed
+
+    def test_not_configured(self, monkeypatch):
+        """Without an endpoint the text passes through with an error."""
+        monkeypatch.delenv("AI_SERVICES_ENDPOINT")
+        result = detect_and_redact_pii(f"Contact {FAKE_EMAIL}")
+        assert result.redacted_text == f"Contact {FAKE_EMAIL}"
+        assert result.error == "PII detection service not configured"
+
+    def test_auth_failure_resets_client(self):
+        """A rejected credential is dropped so the next call re-authenticates."""
+        FakeLanguageClient.error = ClientAuthenticationError("token rejected")
+        result = detect_and_redact_pii(f"Contact {FAKE_EMAIL}")
+        assert result.error
+        assert pii_detector._client is None
+        assert FakeLanguageClient.instances[0].credential.closed
+
+        FakeLanguageClient.error = None
+        result = detect_and_redact_pii(f"Contact {FAKE_EMAIL}")
+        assert result.redacted_text == "Contact [REDACTED-Email]"
+        assert len(FakeLanguageClient.instances) == 2
+
+    def test_other_failures_keep_client(self):
+        """Transient service errors don't throw away the client."""
+        FakeLanguageClient.error = ConnectionError("reset by peer")
+        detect_and_redact_pii(f"Contact {FAKE_EMAIL}")
+        assert pii_detector._client is FakeLanguageClient.instances[0]
+
+
+def chunked_text(chunks: int) -> str:
+    """Text with FAKE_EMAIL once per document-sized segment."""
+    segment = f"Contact {FAKE_EMAIL} ".ljust(pii_detector.MAX_DOCUMENT_CHARS, "x")
+    return segment * chunks
+
+
+def prose(words: int) -> str:
+    """Whitespace-separated filler text."""
+    return " ".join(f"word{i % 10}" for i in range(words))
+
+
+class TestChunking:
+    """Test boundary-aware chunking with overlap."""
+
+    def test_short_text_single_chunk(self):
+        """Text under the limit is one chunk at offset 0."""
+        assert pii_detector.split_into_chunks("Denver") == [(0, "Denver")]
+
+    def test_chunks_end_on_boundaries(self):
+        """Chunks end after whitespace or a JSON delimiter and stay within the limit."""
+        text = '{"notes": "' + prose(3000) + '"}'
+        chunks = pii_detector.split_into_chunks(text, max_chars=500, overlap=40)
+        for chunk in chunks[:-1]:
+            assert len(chunk.text) <= 500
+            assert chunk.text[-1] in pii_detector.CHUNK_BOUNDARY_CHARS
+
+    def test_chunks_cover_text_with_bounded_overlap(self):
+        """Offsets are correct and neighbors overlap by at most the window."""
+        text = prose(3000)
+        chunks = pii_detector.split_into_chunks(text, max_chars=500, overlap=40)
+        for chunk in chunks:
+            assert text[chunk.offset:chunk.offset + len(chunk.text)] == chunk.text
+        for previous, current in zip(chunks, chunks[1:]):
+            previous_end = previous.offset + len(previous.text)
+            assert previous.offset < current.offset <= previous_end
+            assert previous_end - current.offset <= 40
+        assert chunks[-1].offset + len(chunks[-1].text) == len(text)
+
+    def test_no_boundary_cuts_hard(self):
+        """Text without boundaries is still split within the limit."""
+        chunks = pii_detector.split_into_chunks("x" * 1200, max_chars=500, overlap=40)
+        assert [len(chunk.text) for chunk in chunks] == [500, 500, 280]
+
+    def test_entity_on_chunk_edge_redacted(self):
+        """An email straddling a chunk boundary is found by the overlapping chunk."""
+        # No boundaries near the cut, so the first chunk ends mid-email
+        text = "x" * (pii_detector.MAX_DOCUMENT_CHARS - 10) + FAKE_EMAIL + " after"
+        result = detect_and_redact_pii(text)
+        assert FAKE_EMAIL not in result.redacted_text
+        assert result.redacted_text.endswith("[REDACTED-Email] after")
+        assert len(result.entities_found) == 1
+
+    def test_overlap_duplicates_merged(self):
+        """An entity inside the overlap, seen by both chunks, is reported once."""
+        # The email ends just before the first chunk's cut, inside the overlap
+        lead = prose(900)[:pii_detector.MAX_DOCUMENT_CHARS - 60].rsplit(" ", 1)[0]
+        text = f"{lead} {FAKE_EMAIL} " + prose(800)
+        chunks = pii_detector.split_into_chunks(text)
+        assert sum(FAKE_EMAIL in chunk.text for chunk in chunks) == 2
+
+        result = detect_and_redact_pii(text)
+        assert len(result.entities_found) == 1
+        assert result.redacted_text == text.replace(FAKE_EMAIL, "[REDACTED-Email]")
+
+    def test_merge_partial_spans(self):
+        """Overlapping entities merge into their union under the longer entity's category."""
+        text = "0123456789" * 4
+        partial = pii_detector.PIIEntity(10, 5, "Person", None, 0.6)
+        whole = pii_detector.PIIEntity(12, 20, "Email", None, 0.9)
+        redacted, found = pii_detector.redact_entities(text, [whole, partial, whole])
+        assert redacted == text[:10] + "[REDACTED-Email]" + text[32:]
+        assert found == [{"category": "Email", "subcategory": None, "confidence": 0.9, "text_length": 22}]
+
+
+class TestBatchedRecognition:
+    """Test packing chunks of large texts into multi-document requests."""
+
+    def test_chunks_packed_per_request(self):
+        """Ten documents' worth of text takes two requests of five."""
+        text = chunked_text(9)
+        result = detect_and_redact_pii(text)
+        client = FakeLanguageClient.instances[0]
+        assert client.batch_sizes == [5, 5]
+        assert len(result.entities_found) == 9
+        assert FAKE_EMAIL not in result.redacted_text
+        assert result.redacted_text.count("Contact [REDACTED-Email] ") == 9
+
+    def test_batch_size_setting(self, monkeypatch):
+        """PII_BATCH_DOCUMENTS sets documents per request."""
+        monkeypatch.setenv("PII_BATCH_DOCUMENTS", "3")
+        text = chunked_text(7)
+        detect_and_redact_pii(text)
+        sizes = FakeLanguageClient.instances[0].batch_sizes
+        assert sizes[:-1] == [3] * (len(sizes) - 1)
+        assert sum(sizes) == len(pii_detector.split_into_chunks(text))
+
+    def test_results_mapped_to_their_chunks(self):
+        """Chunk order and offsets survive batching."""
+        text = "".join(f"{i:04d}".ljust(pii_detector.MAX_DOCUMENT_CHARS, "-") for i in range(6)) + "tail"
+        result = detect_and_redact_pii(text)
+        assert result.redacted_text == text
+        assert result.error is None
+
+    def test_document_error_keeps_other_chunks(self):
+        """A failed document is passed through unredacted; the rest are redacted."""
+        bad = "BAD" + prose(900)
+        text = chunked_text(2) + bad + chunked_text(1)
+        result = detect_and_redact_pii(text)
+        assert result.error == "InvalidDocument"
+        assert len(result.entities_found) == 3
+        assert bad[:4000] in result.redacted_text
+
+
+class TestAsyncDetection:
+    """Test the aio pipeline used by sanitize_output."""
+
+    def test_matches_sync_result(self):
+        """The async pipeline redacts exactly like the sync one."""
+        text = chunked_text(12) + "tail"
+        expected = detect_and_redact_pii(text)
+        result = asyncio.run(detect_and_redact_pii_async(text))
+        assert result == expected
+
+    def test_batches_sent_concurrently(self):
+        """Batches of one request overlap instead of running back to back."""
+        text = chunked_text(20)
+        asyncio.run(detect_and_redact_pii_async(text))
+        batches = len(pii_detector.split_into_batches(text))
+        assert batches > 1
+        assert FakeAsyncLanguageClient.max_in_flight == batches
+
+    def test_concurrency_bounded(self, monkeypatch):
+        """PII_MAX_CONCURRENT_REQUESTS caps requests in flight across sanitize calls."""
+        monkeypatch.setenv("PII_MAX_CONCURRENT_REQUESTS", "3")
+
+        async def many():
+            await asyncio.gather(*(detect_and_redact_pii_async(chunked_text(10)) for _ in range(4)))
+
+        asyncio.run(many())
+        assert FakeAsyncLanguageClient.max_in_flight == 3
+
+    def test_client_reused_within_loop(self):
+        """Calls on the same loop share one aio client."""
+        async def twice():
+            await detect_and_redact_pii_async(f"Contact {FAKE_EMAIL}")
+            await detect_and_redact_pii_async(f"Contact {FAKE_EMAIL}")
+
+        asyncio.run(twice())
+        assert len(FakeLanguageClient.instances) == 1
+
+    def test_failure_returns_text_unredacted(self):
+        """A failed request fails the whole text, like the sync pipeline."""
+        FakeLanguageClient.error = ConnectionError("reset by peer")
+        text = chunked_text(6)
+        result = asyncio.run(detect_and_redact_pii_async(text))
+        assert result.redacted_text == text
+        assert result.error == "reset by peer"
+
+    def test_auth_failure_closes_client(self):
+        """A rejected credential drops the aio client too."""
+        FakeLanguageClient.error = ClientAuthenticationError("token rejected")
+        asyncio.run(detect_and_redact_pii_async(f"Contact {FAKE_EMAIL}"))
+        assert pii_detector._async_client is None
+        assert FakeLanguageClient.instances[0].credential.closed
+
+
+# Shaped like the trail-api permit holder and trail list responses
+PERMIT_HOLDER = {
+    "permit_id": "TRAIL-2024-001",
+    "holder_name": "Jordan Rivers",
+    "email": FAKE_EMAIL,
+    "phone": "555-010-4477",
+    "emergency_contact_email": FAKE_EMAIL,
+}
+TRAILS = [
+    {
+        "id": "summit-trail", "name": "Summit Ridge Trail", "difficulty": "Expert",
+        "distance_miles": 8.5, "elevation_gain_ft": 4200, "estimated_time_hours": 8.0,
+        "permit_required": True,
+    },
+    {
+        "id": "base-trail", "name": "Base Camp Loop", "difficulty": "Beginner",
+        "distance_miles": 2.3, "elevation_gain_ft": 350, "estimated_time_hours": 1.5,
+        "permit_required": False,
+    },
+]
+
+
+def mcp_result(payload) -> str:
+    """JSON-RPC tools/call response whose text content is pretty-printed JSON."""
+    return json.dumps({
+        "jsonrpc": "2.0", "id": 7,
+        "result": {"content": [{"type": "text", "text": json.dumps(payload, indent=2)}]},
+    })
+
+
+class TestJsonLeafMode:
+    """Test submitting only the string leaves of JSON bodies."""
+
+    def run(self, body: str):
+        return asyncio.run(detect_and_redact_json_pii_async(body))
+
+    def test_leaves_redacted_in_place(self):
+        """PII in string leaves is redacted and the structure kept."""
+        result = self.run(json.dumps(PERMIT_HOLDER, indent=2))
+        data = json.loads(result.redacted_text)
+        assert list(data) == list(PERMIT_HOLDER)
+        assert data["email"] == "[REDACTED-Email]"
+        assert data["emergency_contact_email"] == "[REDACTED-Email]"
+        assert data["permit_id"] == "TRAIL-2024-001"
+        assert len(result.entities_found) == 1
+
+    def test_only_unique_leaves_submitted(self):
+        """Keys give context; structure, numbers and repeats are not sent."""
+        self.run(json.dumps(PERMIT_HOLDER))
+        (document,) = FakeLanguageClient.instances[0].documents
+        assert document.count(FAKE_EMAIL) == 1
+        assert f"email: {FAKE_EMAIL}" in document
+        assert "{" not in document and '"' not in document
+
+    def test_embedded_tool_output(self):
+        """JSON inside MCP text content is walked and re-serialized."""
+        result = self.run(mcp_result(PERMIT_HOLDER))
+        text = json.loads(result.redacted_text)["result"]["content"][0]["text"]
+        assert json.loads(text)["email"] == "[REDACTED-Email]"
+        assert FAKE_EMAIL not in result.redacted_text
+
+    def test_clean_body_unchanged(self):
+        """Without findings the original bytes are returned."""
+        body = mcp_result(TRAILS)
+        assert self.run(body).redacted_text == body
+
+    def test_non_json_falls_back(self):
+        """Plain text is scanned as raw text."""
+        result = self.run(f"Contact {FAKE_EMAIL} today")
+        assert result.redacted_text == "Contact [REDACTED-Email] today"
+
+    def test_entity_clipped_to_value(self):
+        """An entity reaching into the key prefix only redacts the value."""
+        submission = pii_detector.pack_string_leaves({"name": "Jordan Rivers"})
+        entity = pii_detector.PIIEntity(0, len(submission.text) - 1, "Person", None, 0.9)
+        redacted, found = pii_detector.redact_leaves(submission, [entity])
+        assert redacted == {"Jordan Rivers": "[REDACTED-Person]"}
+        assert found[0]["text_length"] == len("Jordan Rivers")
+
+    def test_pii_in_keys_redacted(self):
+        """Object keys other than field names are submitted and rewritten."""
+        body = json.dumps({"contacts": {FAKE_EMAIL: {"role": "guide"}}})
+        document = pii_detector.pack_string_leaves(json.loads(body)).text
+        assert document == f"contacts: {FAKE_EMAIL}\nrole: guide\n"
+        result = self.run(body)
+        assert FAKE_EMAIL not in result.redacted_text
+        assert json.loads(result.redacted_text) == {"contacts": {"[REDACTED-Email]": {"role": "guide"}}}
+
+    def test_redacted_keys_kept_apart(self):
+        """Keys redacted to the same text do not overwrite each other."""
+        data = {"a@example.com": 1, "b@example.com": 2}
+        rebuilt = pii_detector._map_string_leaves(data, lambda value, key: "[REDACTED-Email]")
+        assert rebuilt == {"[REDACTED-Email]": 1, "[REDACTED-Email] #2": 2}
+
+    def test_submitted_characters_cut(self):
+        """Trail listings submit less than half the raw characters."""
+        for body in (json.dumps(TRAILS, indent=2), mcp_result(TRAILS)):
+            submitted = pii_detector.pack_string_leaves(json.loads(body)).text
+            assert len(submitted) < len(body) / 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,160 @@
+"""Tests for request deadlines and circuit breakers on outbound calls."""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import injection_patterns, prompt_shields, resilience
+from shared.prompt_shields import VerdictCache
+from shared.resilience import CircuitBreaker, CircuitState, Deadline
+
+
+class TestDeadline:
+    """Test the per-request time budget."""
+
+    def test_remaining_counts_down(self):
+        """Remaining time is positive for a fresh budget."""
+        deadline = Deadline(5.0)
+        assert 0 < deadline.remaining() <= 5.0
+        assert not deadline.expired
+
+    def test_expired(self):
+        """A zero budget is immediately expired and never negative."""
+        deadline = Deadline(0.0)
+        assert deadline.expired
+        assert deadline.remaining() == 0.0
+
+    def test_budget_from_app_setting(self, monkeypatch):
+        """SECURITY_REQUEST_BUDGET_SECONDS configures the budget."""
+        monkeypatch.setenv("SECURITY_REQUEST_BUDGET_SECONDS", "2")
+        deadline = Deadline.for_request("abc")
+        assert deadline.remaining() <= 2.0
+        assert deadline.correlation_id == "abc"
+
+
+class TestCircuitBreaker:
+    """Test circuit breaker state transitions."""
+
+    def test_opens_after_threshold(self):
+        """Consecutive failures open the circuit."""
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow_request()
+
+    def test_success_resets_failures(self):
+        """A success in between resets the failure count."""
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_half_open_single_trial(self):
+        """After the reset timeout one trial call is allowed."""
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow_request()
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert not breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_half_open_failure_reopens(self):
+        """A failed trial call opens the circuit again."""
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=0)
+        for _ in range(3):
+            breaker.record_failure()
+        breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+
+    def test_released_trial_allows_next(self):
+        """A released half-open trial lets the next request try again."""
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.release_trial()
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow_request()
+
+    def test_transitions_logged(self, caplog):
+        """State changes are logged as security events."""
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+        with caplog.at_level("INFO", logger="security-function"):
+            breaker.record_failure("corr-1")
+        record = caplog.records[-1]
+        dimensions = record.custom_dimensions
+        assert dimensions["event_type"] == "CIRCUIT_STATE_CHANGED"
+        assert dimensions["new_state"] == "open"
+        assert dimensions["correlation_id"] == "corr-1"
+
+
+class HangingClient:
+    """Prompt Shields client stub that never answers in time."""
+
+    async def shield_prompt(self, user_prompt, documents=None, timeout=None):
+        await asyncio.sleep(10)
+
+
+class TestPromptShieldsResilience:
+    """Test deadline and breaker handling around Prompt Shields."""
+
+    @pytest.fixture(autouse=True)
+    def isolate(self, monkeypatch):
+        monkeypatch.setattr(injection_patterns, "get_prompt_shields_client", lambda: HangingClient())
+        monkeypatch.setattr(prompt_shields, "_verdict_cache", VerdictCache(max_size=0))
+        monkeypatch.setattr(resilience, "_breakers", {})
+
+    def test_deadline_bounds_call(self):
+        """A hanging call is abandoned when the budget runs out (fail open)."""
+        result = asyncio.run(injection_patterns.check_with_prompt_shields(["Denver"], Deadline(0.05)))
+        assert result.is_safe
+
+    def test_fail_closed(self, monkeypatch):
+        """PROMPT_SHIELDS_FAIL_MODE=closed blocks when the service is unavailable."""
+        monkeypatch.setenv("PROMPT_SHIELDS_FAIL_MODE", "closed")
+        result = asyncio.run(injection_patterns.check_with_prompt_shields(["Denver"], Deadline(0.05)))
+        assert not result.is_safe
+        assert result.category == "service_unavailable"
+
+    def test_open_circuit_skips_call(self, monkeypatch):
+        """Once open, the breaker short-circuits without waiting on the service."""
+        monkeypatch.setenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "1")
+        asyncio.run(injection_patterns.check_with_prompt_shields(["Denver"], Deadline(0.05)))
+        assert resilience._breakers["prompt_shields"].state == CircuitState.OPEN
+
+        deadline = Deadline(5.0)
+        result = asyncio.run(injection_patterns.check_with_prompt_shields(["Denver"], deadline))
+        assert result.is_safe
+        assert deadline.remaining() > 4.9
+
+    def test_cancelled_trial_released(self, monkeypatch):
+        """Cancelling a half-open trial call does not wedge the circuit."""
+        breaker = CircuitBreaker("prompt_shields", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        resilience._breakers["prompt_shields"] = breaker
+
+        async def cancel_trial():
+            task = asyncio.create_task(
+                injection_patterns.check_with_prompt_shields(["Denver"], Deadline(5.0))
+            )
+            await asyncio.sleep(0.01)
+            assert breaker.state == CircuitState.HALF_OPEN
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_trial())
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow_request()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,186 @@
+"""Tests for hot-reloadable detection rule packs.
+
+NOTE: Injection payloads and credential values in this file are FAKE test
+fixtures used only to exercise the detection patterns.
+"""
+
+import json
+import logging
+import pytest
+import re
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import injection_patterns, rule_packs
+from shared.credential_scanner import scan_and_redact
+from shared.injection_patterns import check_patterns
+from shared.rule_packs import RulePackError, parse_rule_pack
+
+
+def make_pack(version: str, injection_word: str = "forbidden") -> dict:
+    """Minimal valid rule pack blocking one word."""
+    return {
+        "version": version,
+        "injection_patterns": {
+            "custom": [{"pattern": injection_word, "description": f"{injection_word} detected"}]
+        },
+        "credential_patterns": [
+            {"pattern": r"(?i)(token)\s*=\s*(\w{8,})", "type": "SECRET", "replacement": r"\1=[REDACTED-SECRET]"}
+        ],
+    }
+
+
+@pytest.fixture
+def pack_file(tmp_path, monkeypatch):
+    """Point RULE_PACK_PATH at a temp file and reset the active pack."""
+    path = tmp_path / "pack.json"
+    path.write_text(json.dumps(make_pack("1.0.0")))
+    monkeypatch.setenv("RULE_PACK_PATH", str(path))
+    monkeypatch.setattr(rule_packs, "_active", None)
+    monkeypatch.setattr(rule_packs, "_file_state", None)
+    monkeypatch.setattr(rule_packs, "_next_check", 0.0)
+    yield path
+    # Drop the test pack so later tests see the built-in patterns again
+    monkeypatch.delenv("RULE_PACK_PATH")
+    rule_packs.reload_rule_pack()
+
+
+class TestRulePackValidation:
+    """Test rule pack parsing and validation."""
+
+    def test_valid_pack(self):
+        """A valid document is converted to detector tuples."""
+        pack = parse_rule_pack(make_pack("1.0.0"), "test")
+        assert pack.version == "1.0.0"
+        assert pack.injection_patterns == {"custom": [("forbidden", "forbidden detected")]}
+        assert pack.credential_patterns[0][1] == "SECRET"
+
+    def test_missing_version(self):
+        """Packs must be versioned."""
+        data = make_pack("1.0.0")
+        del data["version"]
+        with pytest.raises(RulePackError, match="version"):
+            parse_rule_pack(data, "test")
+
+    def test_invalid_pattern_rejected(self):
+        """An invalid regex rejects the whole pack."""
+        data = make_pack("1.0.0", injection_word="(unclosed")
+        with pytest.raises(RulePackError, match="invalid pattern"):
+            parse_rule_pack(data, "test")
+
+    def test_builtin_export_round_trips(self):
+        """The exported built-in patterns validate as a pack."""
+        exported = rule_packs.export_rule_pack(rule_packs.builtin_rule_pack())
+        pack = parse_rule_pack(exported, "export")
+        assert pack.injection_patterns == rule_packs.builtin_rule_pack().injection_patterns
+
+    def test_cli_validate(self, tmp_path, capsys):
+        """The validate command reports bad packs with a non-zero exit."""
+        path = tmp_path / "bad.json"
+        path.write_text("{not json")
+        assert rule_packs.main(["validate", str(path)]) == 1
+        assert "Invalid rule pack" in capsys.readouterr().err
+
+
+class TestCombinedMatcher:
+    """Test patterns that only misbehave inside the combined alternation."""
+
+    # Rules without a literal trigger are candidates for every text, so the
+    # combined alternation is used
+    ALWAYS_CANDIDATES = [{"pattern": rf"\d{{{n}}}", "description": "digits"} for n in range(30, 35)]
+
+    def pack(self, *patterns: str) -> dict:
+        data = make_pack("1.0.0")
+        data["injection_patterns"] = {
+            "noise": self.ALWAYS_CANDIDATES,
+            "custom": [{"pattern": p, "description": "custom rule"} for p in patterns],
+        }
+        return data
+
+    def engine(self, *patterns: str):
+        return rule_packs.compile_rule_pack(parse_rule_pack(self.pack(*patterns), "test")).injection_engine
+
+    def test_inline_global_flags(self, tmp_path, capsys):
+        """A rule with inline global flags validates, loads and matches."""
+        path = tmp_path / "pack.json"
+        path.write_text(json.dumps(self.pack("(?i)evil")))
+        assert rule_packs.main(["validate", str(path)]) == 0
+        assert self.engine("(?i)evil").first_match("pure EVIL here").category == "custom"
+
+    def test_repeated_group_names(self):
+        """The same named group in several rules does not break compilation."""
+        engine = self.engine(r"(?P<cmd>rm)\s+-rf", r"(?P<cmd>del)\s+/q")
+        assert engine.first_match("then del /q all").category == "custom"
+
+    def test_backreference_keeps_matching(self):
+        """Backreferences still match when the combined scan is used."""
+        engine = self.engine(r"(['\"])admin\1")
+        assert len(engine.candidates("user='admin'")) > engine.COMBINED_SCAN_THRESHOLD
+        assert engine.first_match("user='admin'").category == "custom"
+        assert engine.first_match("user='admin\"") is None
+
+    def test_uncombinable_pack_keeps_previous(self, monkeypatch):
+        """A pack the matcher cannot compile is rejected, keeping the last good one."""
+        def broken(patterns):
+            raise re.error("redefinition of group name")
+
+        monkeypatch.setattr(injection_patterns, "InjectionRuleEngine", broken)
+        with pytest.raises(RulePackError, match="cannot be combined"):
+            rule_packs.compile_rule_pack(parse_rule_pack(make_pack("1.0.0"), "test"))
+
+
+class TestHotReload:
+    """Test loading and atomically swapping rule packs."""
+
+    def test_builtin_pack_without_path(self):
+        """The built-in patterns are active when no pack is configured."""
+        assert rule_packs.get_active_rule_pack().version == rule_packs.BUILTIN_VERSION
+        assert check_patterns("data; rm -rf /").category == "shell_injection"
+
+    def test_pack_file_loaded(self, pack_file):
+        """Detectors use the patterns from RULE_PACK_PATH."""
+        assert rule_packs.get_active_rule_pack().version == "1.0.0"
+        assert check_patterns("this is forbidden").category == "custom"
+        assert check_patterns("data; rm -rf /").is_safe
+        assert "[REDACTED-SECRET]" in scan_and_redact("token=abcdefgh1234").redacted_text
+
+    def test_changed_file_swapped_in(self, pack_file):
+        """A changed file is picked up on the next check."""
+        rule_packs.get_active_rule_pack()
+        pack_file.write_text(json.dumps(make_pack("1.1.0", injection_word="blocked")))
+
+        assert rule_packs.reload_rule_pack().version == "1.1.0"
+        assert check_patterns("this is blocked").category == "custom"
+        assert check_patterns("this is forbidden").is_safe
+
+    def test_unchanged_file_not_reloaded_before_interval(self, pack_file, monkeypatch):
+        """The file is not re-read until the check interval elapses."""
+        monkeypatch.setenv("RULE_PACK_CHECK_INTERVAL_SECONDS", "3600")
+        active = rule_packs.get_active_rule_pack()
+        pack_file.write_text(json.dumps(make_pack("2.0.0")))
+        assert rule_packs.get_active_rule_pack() is active
+
+    def test_invalid_update_keeps_previous_pack(self, pack_file):
+        """A broken update is logged and the last good pack stays active."""
+        rule_packs.get_active_rule_pack()
+        pack_file.write_text(json.dumps({"version": "broken"}))
+
+        assert rule_packs.reload_rule_pack().version == "1.0.0"
+        assert check_patterns("this is forbidden").category == "custom"
+
+    def test_invalid_pack_at_startup_uses_builtin(self, pack_file):
+        """Without a last good pack the built-in patterns are used."""
+        pack_file.write_text("{not json")
+        assert rule_packs.get_active_rule_pack().version == rule_packs.BUILTIN_VERSION
+
+    def test_version_attached_to_events(self, pack_file, caplog):
+        """Logged security events carry the active pack version."""
+        with caplog.at_level(logging.INFO, logger="security-function"):
+            rule_packs.get_active_rule_pack()
+
+        loaded = [r for r in caplog.records if r.custom_dimensions["event_type"] == "RULE_PACK_LOADED"]
+        assert loaded
+        assert loaded[-1].custom_dimensions["rule_pack_version"] == "1.0.0"